@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .media import URL_CACHE_TTL, public_base_url
+
+
+class ProductCache:
+    """
+    Bounded per-process LRU of serialized product payloads.
+
+    Every entry remembers the catalog version it was built under and only
+    counts as a hit while that version is still current. Catalog writes bump
+    the version in the database, so one write invalidates the entries held by
+    every gunicorn worker without any cross-process messaging.
+
+    Payloads embed image URLs, which are presigned unless a public media
+    base URL is configured. Entries then also expire after `ttl` seconds so
+    no link is served past its signature.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, expires, payload = entry
+            if entry_version != version or (expires is not None and expires <= time.monotonic()):
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, keys, version, payload):
+        """Store `payload` under each of `keys` (e.g. its productId and SKU lookups)"""
+        ttl = self.ttl if self.ttl is not None and not public_base_url() else None
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (version, expires, payload)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# A cached URL may already be up to URL_CACHE_TTL old when the payload is built
+product_cache = ProductCache(
+    getattr(settings, 'PRODUCT_CACHE_SIZE', 2000),
+    getattr(settings, 'PRODUCT_CACHE_TTL', URL_CACHE_TTL // 2)
+)
@@ -1,148 +1,385 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
 from rest_framework.permissions import AllowAny
 from categories.models import (
     Products, ProductTag, ProductImage, ProductFeature,
-    ProductMaterial, ProductStockModel, SubCategoriesModel, CategoriesModel
+    ProductMaterial, ProductStockModel, SubCategoriesModel, CategoriesModel,
+    DashboardSnapshot
 )
+from categories.images import variant_names, resolve_variant_urls
+from categories.media import media_url, url_window
+from categories.versioning import current_catalog_version, successful_condition, SALES_SCOPE
 from rest_framework.decorators import (
     api_view, authentication_classes, permission_classes
 )
 from django.http import JsonResponse
-from django.db.models import Prefetch
+from django.db.models import Prefetch, F, Window
+from django.db.models.functions import RowNumber
 
+logger = logging.getLogger(__name__)
 
-@api_view(['GET'])
-@authentication_classes([])
-@permission_classes([AllowAny])
-def dashboardHome(request):
+DASHBOARD_RAILS = {
+    'bestsellers': ('-totalSales', '-createdAt'),
+    'trending': ('-trendingScore', '-totalSales', '-createdAt'),
+    'new_arrivals': ('-createdAt',),
+    'top_discounted': ('-discountPerc', '-discount', '-totalSales'),
+}
+DEFAULT_RAIL = 'bestsellers'
+DEFAULT_LIMIT = 3
+MAX_LIMIT = 20
+DASHBOARD_VIDEO = 'https://venusa.s3.ap-south-1.amazonaws.com/venusa/dashboard_content/C0021_3.mp4'
+# Bumped when the stored payload changes shape; older snapshots are rebuilt on read
+SNAPSHOT_FORMAT = 2
+# How long a snapshot may keep serving rankings from before the latest sale
+SALES_REFRESH = timedelta(seconds=getattr(settings, 'DASHBOARD_SALES_REFRESH', 300))
+
+
+def serialize_dashboard_product(product):
     """
-    Dashboard API: Returns top 3 products from different subcategories across all categories.
-    Products are ordered by totalSales (highest first) within each subcategory.
+    Flatten a product (with prefetched children) into the dashboard format.
+    Images are kept as storage names; resolve_dashboard_media() turns them
+    into URLs when the snapshot is served, since signed URLs expire.
     """
-    try:
-        # Get all categories with their subcategories and products in one optimized query
-        categories = CategoriesModel.objects.prefetch_related(
-            'subcategories',
-            'subcategories__products'
-        ).all()
-        print("Fetched categories:", categories)
-        if not categories.exists():
-            return JsonResponse({
-                'status': 'error',
-                'message': 'No categories found',
-                'data': []
-            }, status=404)
+    return {
+        'productId': str(product.productId),
+        'productName': product.productName,
+        'description': product.description,
+        'price': str(product.price),
+        'SKU': product.SKU,
+        'discount': str(product.discount),
+        'discountPerc': str(product.discountPerc),
+        'discountedPrice': str(product.discounted_price),
+        'totalSales': product.totalSales,
+        'trendingScore': product.trendingScore,
+        'totalStock': product.totalStock,
+        'isActive': product.isActive,
+        'createdAt': product.createdAt.isoformat() if product.createdAt else None,
+        'updatedAt': product.updatedAt.isoformat() if product.updatedAt else None,
+        'images': [
+            {
+                'id': img.pk,  # Use pk instead of id
+                'image': img.image.name or None,
+                'variants': variant_names(img)
+            }
+            for img in product.images.all()
+        ],
+        'tags': [tag.tag for tag in product.tags.all()],
+        'materials': [material.material for material in product.materials.all()],
+        'keyFeatures': [feature.feature for feature in product.keyFeatures.all()],
+        'stocks': [
+            {
+                'size': stock.size,
+                'quantity': stock.quantity,
+                'color': stock.color
+            }
+            for stock in product.stocks.all()
+        ]
+    }
+
+
+def top_products_per_subcategory(limit=3, ordering=DASHBOARD_RAILS[DEFAULT_RAIL]):
+    """
+    Return {subCategoryId: [products]} holding the first `limit` active products
+    of every subcategory under `ordering`. Ranking is done in one ROW_NUMBER()
+    window query; children are loaded with one prefetch query per relation, so
+    the query count does not depend on the number of subcategories.
+    """
+    order_by = [
+        F(key[1:]).desc() if key.startswith('-') else F(key).asc()
+        for key in ordering
+    ]
+    ranked = Products.objects.filter(isActive=True).annotate(
+        railRank=Window(
+            expression=RowNumber(),
+            partition_by=[F('subCategories')],
+            order_by=order_by + [F('productId').asc()]
+        )
+    ).filter(railRank__lte=limit).order_by('subCategories', 'railRank').prefetch_related(
+        'images',
+        'tags',
+        'materials',
+        'keyFeatures',
+        'stocks'
+    )
+
+    grouped = {}
+    for product in ranked:
+        grouped.setdefault(product.subCategories_id, []).append(product)
+    return grouped
+
 
-        # Build response data
-        response_data = []
-        print("Building response data...")
-        for category in categories:
-            print(f"Processing category: {category.name}")
+def build_dashboard_payload(rail=DEFAULT_RAIL, limit=DEFAULT_LIMIT):
+    """
+    Build the dashboard document: top `limit` products from every subcategory,
+    grouped by category and ordered by the rail's ranking key.
+    """
+    # Read first: a sale landing mid-build leaves the snapshot due for a refresh
+    sales_version, _ = current_catalog_version(SALES_SCOPE)
+    top_products = top_products_per_subcategory(limit, DASHBOARD_RAILS[rail])
+    subcategories = SubCategoriesModel.objects.select_related('categories').filter(
+        subCategoryId__in=top_products.keys()
+    ).order_by('categories__createdAt', 'createdAt')
+
+    response_data = []
+    categories_by_id = {}
+    for subcategory in subcategories:
+        category = subcategory.categories
+        category_data = categories_by_id.get(category.categoryId)
+        if category_data is None:
             category_data = {
                 'categoryId': str(category.categoryId),
                 'categoryName': category.name,
-                'categoryImage': category.image.url if category.image else None,
+                'categoryImage': category.image.name or None,
+                'categoryImageVariants': variant_names(category),
                 'subcategories': []
             }
+            categories_by_id[category.categoryId] = category_data
+            response_data.append(category_data)
 
-            # Get subcategories for this category
-            subcategories = category.subcategories.all()
-            print(f"Found {len(subcategories)} subcategories for category {category.name}")
-            for subcategory in subcategories:
-                # Get top 3 products by totalSales for this subcategory
-                top_products = Products.objects.filter(
-                    subCategories=subcategory,
-                    isActive=True
-                ).select_related('subCategories').prefetch_related(
-                    'images',
-                    'tags',
-                    'materials',
-                    'keyFeatures',
-                    'stocks'
-                ).order_by('-totalSales', '-createdAt')[:3]
-
-                if not top_products.exists():
-                    continue
-                print(f"Top products for subcategory {subcategory.name}: {[p.productName for p in top_products]}")
-                # Serialize products for this subcategory
-                products_list = []
-                for product in top_products:
-                    product_data = {
-                        'productId': str(product.productId),
-                        'productName': product.productName,
-                        'description': product.description,
-                        'price': str(product.price),
-                        'SKU': product.SKU,
-                        'discount': str(product.discount),
-                        'discountPerc': str(product.discountPerc),
-                        'discountedPrice': str(product.discounted_price),
-                        'totalSales': product.totalSales,
-                        'totalStock': product.total_stock,
-                        'isActive': product.isActive,
-                        'createdAt': product.createdAt.isoformat() if product.createdAt else None,
-                        'updatedAt': product.updatedAt.isoformat() if product.updatedAt else None,
-                        'images': [
-                            {
-                                'id': img.pk,  # Use pk instead of id
-                                'image': img.image.url if img.image else None
-                            }
-                            for img in product.images.all()
-                        ],
-                        'tags': [tag.tag for tag in product.tags.all()],
-                        'materials': [material.material for material in product.materials.all()],
-                        'keyFeatures': [feature.feature for feature in product.keyFeatures.all()],
-                        'stocks': [
-                            {
-                                'size': stock.size,
-                                'quantity': stock.quantity,
-                                'color': stock.color
-                            }
-                            for stock in product.stocks.all()
-                        ]
-                    }
-                    products_list.append(product_data)
-                print(f"Serialized products for subcategory {subcategory.name}: {products_list}")
-                # Add subcategory with its products
-                subcategory_data = {
-                    'subCategoryId': str(subcategory.subCategoryId),
-                    'subCategoryName': subcategory.name,
-                    'collectionName': subcategory.collectionName,
-                    'products': products_list
-                }
-                print(f"Adding subcategory data for {subcategory.name}: {subcategory_data}")
-                category_data['subcategories'].append(subcategory_data)
-
-            # Only include categories that have subcategories with products
-            if category_data['subcategories']:
-                response_data.append(category_data)
+        category_data['subcategories'].append({
+            'subCategoryId': str(subcategory.subCategoryId),
+            'subCategoryName': subcategory.name,
+            'collectionName': subcategory.collectionName,
+            'products': [
+                serialize_dashboard_product(product)
+                for product in top_products[subcategory.subCategoryId]
+            ]
+        })
 
-        # Calculate totals
-        total_categories = len(response_data)
-        total_subcategories = sum(len(cat['subcategories']) for cat in response_data)
-        total_products = sum(
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'hasCategories': bool(response_data) or CategoriesModel.objects.exists(),
+        'rail': rail,
+        'limit': limit,
+        'salesVersion': sales_version,
+        'totalCategories': len(response_data),
+        'totalSubcategories': sum(len(cat['subcategories']) for cat in response_data),
+        'totalProducts': sum(
             len(subcat['products'])
             for cat in response_data
             for subcat in cat['subcategories']
-        )
-        print(f"Totals - Categories: {total_categories}, Subcategories: {total_subcategories}, Products: {total_products}")
+        ),
+        'data': response_data
+    }
+
+
+def resolve_dashboard_media(data):
+    """Copy of a payload's `data` with the stored image names replaced by URLs"""
+    return [
+        {
+            **category,
+            'categoryImage': media_url(category['categoryImage']),
+            'categoryImageVariants': resolve_variant_urls(category['categoryImageVariants']),
+            'subcategories': [
+                {
+                    **subcategory,
+                    'products': [
+                        {
+                            **product,
+                            'images': [
+                                {
+                                    **image,
+                                    'image': media_url(image['image']),
+                                    'variants': resolve_variant_urls(image['variants'])
+                                }
+                                for image in product['images']
+                            ]
+                        }
+                        for product in subcategory['products']
+                    ]
+                }
+                for subcategory in category['subcategories']
+            ]
+        }
+        for category in data
+    ]
+
+
+def snapshot_key(rail, limit):
+    return f'{rail}:{limit}'
+
+
+def rebuild_dashboard(rail=DEFAULT_RAIL, limit=DEFAULT_LIMIT):
+    """Recompute one dashboard rail and persist it"""
+    payload = build_dashboard_payload(rail, limit)
+    DashboardSnapshot.objects.update_or_create(key=snapshot_key(rail, limit), defaults={'payload': payload})
+    return payload
+
+
+def rebuild_all_dashboards(rails=None):
+    """
+    Recompute every rail that has been requested so far, plus the default one.
+    `rails` narrows the rebuild to those rails.
+    """
+    keys = set(DashboardSnapshot.objects.values_list('key', flat=True))
+    keys.add(snapshot_key(DEFAULT_RAIL, DEFAULT_LIMIT))
+    for key in keys:
+        rail, _, limit = key.partition(':')
+        if rail not in DASHBOARD_RAILS or not limit.isdigit():
+            DashboardSnapshot.objects.filter(key=key).delete()
+            continue
+        if rails is None or rail in rails:
+            rebuild_dashboard(rail, int(limit))
+
+
+def sales_refresh_due(snapshot):
+    """
+    Whether a snapshot should be rebuilt for sales made since it was built.
+    Checkouts don't bump the catalog version, so rankings are refreshed
+    here instead, at most once per SALES_REFRESH.
+    """
+    if timezone.now() - snapshot.builtAt < SALES_REFRESH:
+        return False
+    sales_version, _ = current_catalog_version(SALES_SCOPE)
+    return snapshot.payload.get('salesVersion', 0) != sales_version
+
+
+# ============ BACKGROUND REBUILDS ============
+
+_rebuild_lock = threading.Lock()
+_rebuild_state = {'running': False, 'dirty': False}
+
+
+def _rebuild_worker():
+    try:
+        while True:
+            with _rebuild_lock:
+                _rebuild_state['dirty'] = False
+            try:
+                rebuild_all_dashboards()
+            except Exception:
+                logger.exception("Dashboard rebuild failed")
+            with _rebuild_lock:
+                # Another write landed while we were rebuilding; go again
+                if not _rebuild_state['dirty']:
+                    _rebuild_state['running'] = False
+                    return
+    finally:
+        connections.close_all()
+
+
+def schedule_dashboard_rebuild():
+    """
+    Rebuild the dashboard snapshot off the request path. Bursts of writes
+    (e.g. an admin save with several inlines) collapse into a single rebuild.
+    """
+    if not getattr(settings, 'DASHBOARD_ASYNC_REBUILD', True):
+        rebuild_all_dashboards()
+        return
+
+    with _rebuild_lock:
+        _rebuild_state['dirty'] = True
+        if _rebuild_state['running']:
+            return
+        _rebuild_state['running'] = True
+
+    threading.Thread(target=_rebuild_worker, name='dashboard-rebuild', daemon=True).start()
+
+
+def _cached_snapshot(request, key):
+    # The conditional-GET check and the view share one snapshot read per request
+    cache = request.__dict__.setdefault('_dashboard_snapshots', {})
+    if key not in cache:
+        cache[key] = DashboardSnapshot.objects.filter(key=key).first()
+    return cache[key]
+
+
+def _requested_snapshot(request):
+    key = snapshot_key(request.GET.get('rail', DEFAULT_RAIL), request.GET.get('limit', DEFAULT_LIMIT))
+    return _cached_snapshot(request, key)
+
+
+def dashboard_etag(request, *args, **kwargs):
+    # Keyed on the snapshot itself rather than the catalog version: the
+    # snapshot is rebuilt in the background after a write, and an ETag must
+    # not be handed out for a document that is about to change.
+    # The signing window is part of the tag so cached copies are not
+    # revalidated past the lifetime of the signed URLs they embed.
+    snapshot = _requested_snapshot(request)
+    if not snapshot:
+        return None
+    window = url_window()
+    etag = f'{snapshot.key}-{snapshot.builtAt.timestamp()}'
+    return f'{etag}-{window}' if window is not None else etag
+
+
+def dashboard_last_modified(request, *args, **kwargs):
+    snapshot = _requested_snapshot(request)
+    if not snapshot:
+        return None
+    window = url_window()
+    if window is None:
+        return snapshot.builtAt
+    return max(snapshot.builtAt, datetime.fromtimestamp(window, tz=dt_timezone.utc))
+
+
+@successful_condition(etag_func=dashboard_etag, last_modified_func=dashboard_last_modified)
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def dashboardHome(request):
+    """
+    Dashboard API: Returns the top N products of every subcategory across all categories.
+    Query params:
+        rail  - ranking to use: bestsellers (default), trending, new_arrivals or top_discounted
+        limit - products per subcategory (default 3, max 20)
+    Served from the precomputed DashboardSnapshot; built inline only on a cold start.
+    """
+    rail = request.GET.get('rail', DEFAULT_RAIL)
+    if rail not in DASHBOARD_RAILS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f"Invalid rail. Choose one of: {', '.join(DASHBOARD_RAILS)}",
+            'data': []
+        }, status=400)
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'limit must be an integer between 1 and {MAX_LIMIT}',
+            'data': []
+        }, status=400)
+
+    try:
+        snapshot = _cached_snapshot(request._request, snapshot_key(rail, limit))
+        if snapshot and snapshot.payload.get('format') == SNAPSHOT_FORMAT:
+            payload = snapshot.payload
+            if sales_refresh_due(snapshot):
+                schedule_dashboard_rebuild()
+        else:
+            payload = rebuild_dashboard(rail, limit)
+
+        if not payload['hasCategories']:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'No categories found',
+                'data': []
+            }, status=404)
+
         return JsonResponse({
             'status': 'success',
-            'message': 'Successfully retrieved top 3 products from different subcategories',
-            'dashboard_video': 'https://venusa.s3.ap-south-1.amazonaws.com/venusa/dashboard_content/C0021_3.mp4',
-            'totalCategories': total_categories,
-            'totalSubcategories': total_subcategories,
-            'totalProducts': total_products,
-            'data': response_data
+            'message': f'Successfully retrieved top {limit} products from different subcategories',
+            'dashboard_video': DASHBOARD_VIDEO,
+            'rail': rail,
+            'totalCategories': payload['totalCategories'],
+            'totalSubcategories': payload['totalSubcategories'],
+            'totalProducts': payload['totalProducts'],
+            'data': resolve_dashboard_media(payload['data'])
         }, status=200)
 
     except Exception as e:
-        # Log the full error for debugging
-        print(f"Dashboard API Error: {str(e)}")
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Dashboard API Error: {error_trace}")
+        logger.exception("Dashboard API Error")
 
         return JsonResponse({
             'status': 'error',
             'message': f'An error occurred: {str(e)}',
             'data': []
-        }, status=500)
\ No newline at end of file
+        }, status=500)
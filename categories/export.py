@@ -0,0 +1,39 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Products
+from .serializers import ProductFieldSelection
+
+EXPORT_FORMATS = ('ndjson', 'json')
+DEFAULT_CHUNK_SIZE = 500
+
+
+def iter_catalog(selection=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield every product as a dict, in productId order.
+    Rows come from a server-side cursor in chunks of `chunk_size`, and the
+    child tables are prefetched once per chunk, so memory stays flat no
+    matter how large the catalog is.
+    """
+    selection = selection or ProductFieldSelection()
+    products = selection.apply(Products.objects.order_by('productId'))
+    serializer = selection.serializer(None)
+    for product in products.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(product)
+
+
+def iter_catalog_export(output='ndjson', selection=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encode iter_catalog() as NDJSON lines or as one JSON array, piece by piece"""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    products = iter_catalog(selection, chunk_size)
+
+    if output == 'ndjson':
+        for product in products:
+            yield encoder.encode(product) + '\n'
+        return
+
+    yield '['
+    for index, product in enumerate(products):
+        yield (',' if index else '') + encoder.encode(product)
+    yield ']\n'
@@ -0,0 +1,211 @@
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import (
+    Products, ProductTag, ProductMaterial, ProductStockModel,
+    ProductFacet, FacetCount, FACET_CHOICES
+)
+
+FACETS = tuple(name for name, _ in FACET_CHOICES)
+# Query params filtered through the facet index (price uses price_min/price_max)
+FILTER_FACETS = ('subcategory', 'size', 'color', 'material', 'tag')
+# Upper bound is exclusive; None means open ended
+PRICE_BUCKETS = ((0, 500), (500, 1000), (1000, 2000), (2000, 5000), (5000, None))
+
+
+def price_bucket(price):
+    for low, high in PRICE_BUCKETS:
+        if high is None:
+            return f'{low}+'
+        if price < high:
+            return f'{low}-{high}'
+
+
+def compute_product_facets(product_ids):
+    """Current (productId, facet, value) rows for the given products, read from the source tables"""
+    rows = set()
+    for pk, subcategory_id, price in Products.objects.filter(pk__in=product_ids).values_list(
+            'pk', 'subCategories_id', 'price'):
+        rows.add((pk, 'subcategory', str(subcategory_id)))
+        rows.add((pk, 'price', price_bucket(price)))
+    # Only variants that can actually be bought count towards size/color
+    for pk, size, color in ProductStockModel.objects.filter(
+            product_id__in=product_ids, quantity__gt=0).values_list('product_id', 'size', 'color'):
+        rows.add((pk, 'size', str(size)))
+        rows.add((pk, 'color', color))
+    for pk, material in ProductMaterial.objects.filter(product_id__in=product_ids).values_list('product_id', 'material'):
+        rows.add((pk, 'material', material))
+    for pk, tag in ProductTag.objects.filter(product_id__in=product_ids).values_list('product_id', 'tag'):
+        rows.add((pk, 'tag', tag))
+    return rows
+
+
+def _apply_count_deltas(deltas):
+    """Shift FacetCount rows by the given {(facet, value): delta}, one UPDATE per distinct delta"""
+    by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(key)
+    if not by_delta:
+        return
+
+    FacetCount.objects.bulk_create(
+        [FacetCount(facet=facet, value=value) for keys in by_delta.values() for facet, value in keys],
+        ignore_conflicts=True
+    )
+    for delta, keys in by_delta.items():
+        match = Q()
+        for facet, value in keys:
+            match |= Q(facet=facet, value=value)
+        FacetCount.objects.filter(match).update(count=F('count') + delta)
+
+
+@transaction.atomic
+def refresh_product_facets(product_ids):
+    """
+    Bring the facet index of `product_ids` in line with their current data,
+    touching only the rows that changed and adjusting FacetCount by the diff.
+    """
+    product_ids = list(product_ids)
+    # Serialise concurrent refreshes of the same products so the counts stay exact
+    list(Products.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', flat=True))
+
+    existing = {
+        (product_id, facet, value): pk
+        for pk, product_id, facet, value in ProductFacet.objects.filter(
+            product_id__in=product_ids).values_list('pk', 'product_id', 'facet', 'value')
+    }
+    current = compute_product_facets(product_ids)
+    added = current - existing.keys()
+    removed = existing.keys() - current
+
+    if removed:
+        ProductFacet.objects.filter(pk__in=[existing[row] for row in removed]).delete()
+    ProductFacet.objects.bulk_create([
+        ProductFacet(product_id=product_id, facet=facet, value=value)
+        for product_id, facet, value in added
+    ])
+
+    deltas = Counter((facet, value) for _, facet, value in added)
+    deltas.subtract((facet, value) for _, facet, value in removed)
+    _apply_count_deltas(deltas)
+
+
+def removed_facet_deltas(product_ids):
+    """
+    FacetCount changes for dropping `product_ids` from the index. Read before
+    the products are deleted: their facet rows go with the cascade.
+    """
+    deltas = Counter()
+    for facet, value in ProductFacet.objects.filter(product_id__in=product_ids).values_list('facet', 'value'):
+        deltas[(facet, value)] -= 1
+    return deltas
+
+
+def forget_product_facets(deltas):
+    """Apply removed_facet_deltas() once the products are actually gone"""
+    _apply_count_deltas(deltas)
+
+
+@transaction.atomic
+def rebuild_all_facets(chunk_size=500):
+    """Recompute the whole facet index and FacetCount from scratch"""
+    ProductFacet.objects.all().delete()
+    product_ids = list(Products.objects.values_list('pk', flat=True))
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        ProductFacet.objects.bulk_create([
+            ProductFacet(product_id=product_id, facet=facet, value=value)
+            for product_id, facet, value in compute_product_facets(chunk)
+        ])
+
+    FacetCount.objects.all().delete()
+    FacetCount.objects.bulk_create([
+        FacetCount(facet=row['facet'], value=row['value'], count=row['count'])
+        for row in ProductFacet.objects.values('facet', 'value').annotate(count=Count('id')).order_by()
+    ])
+
+
+# ============ FILTERING ============
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def _decimal_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Must be a number'})
+
+
+def apply_facet_filters(queryset, request):
+    """
+    Narrow a Products queryset by ?subcategory= ?size= ?color= ?material= ?tag=
+    (comma separated, any of) and ?price_min= / ?price_max=. When both size
+    and color are given a product matches only if one in-stock variant has both.
+    Returns (queryset, filtered) where filtered says whether any filter applied.
+    """
+    params = request.query_params
+    filtered = False
+
+    sizes, colors = _split(params.get('size')), _split(params.get('color'))
+    if sizes and colors:
+        # Both must hold for the same stocked variant, not just somewhere on the
+        # product; a subquery rather than a join keeps the rows distinct
+        if not all(size.lstrip('-').isdigit() for size in sizes):
+            raise ValidationError({'size': 'Must be a comma separated list of integers'})
+        queryset = queryset.filter(pk__in=ProductStockModel.objects.filter(
+            size__in=[int(size) for size in sizes], color__in=colors, quantity__gt=0
+        ).values('product'))
+        filtered = True
+
+    for facet in FILTER_FACETS:
+        values = _split(params.get(facet))
+        if sizes and colors and facet in ('size', 'color'):
+            continue
+        if values:
+            queryset = queryset.filter(
+                pk__in=ProductFacet.objects.filter(facet=facet, value__in=values).values('product')
+            )
+            filtered = True
+
+    price_min = _decimal_param(params, 'price_min')
+    price_max = _decimal_param(params, 'price_max')
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+        filtered = True
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+        filtered = True
+
+    return queryset, filtered
+
+
+def facet_counts(queryset=None):
+    """
+    Facet counts as {facet: [{'value', 'count'}]}.
+    With no queryset the precomputed catalog-wide counts are returned; otherwise
+    the counts for the products in `queryset` come from one grouped query over
+    the facet index.
+    """
+    if queryset is None:
+        rows = FacetCount.objects.filter(count__gt=0).values('facet', 'value', 'count')
+    else:
+        rows = ProductFacet.objects.filter(
+            product__in=queryset.order_by().values('pk')
+        ).values('facet', 'value').annotate(count=Count('id')).order_by()
+
+    counts = {facet: [] for facet in FACETS}
+    for row in rows:
+        counts[row['facet']].append({'value': row['value'], 'count': row['count']})
+    for values in counts.values():
+        values.sort(key=lambda item: (-item['count'], item['value']))
+    return counts
@@ -0,0 +1,205 @@
+import io
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from PIL import Image, ImageOps
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from .media import media_url
+
+logger = logging.getLogger(__name__)
+
+# Models with an `image` field and a `variants` map generated from it
+IMAGE_MODELS = ('categories.ProductImage', 'categories.CategoriesModel', 'categories.SubCategoriesModel')
+VARIANT_WIDTHS = tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (160, 480, 960)))
+# format key -> (Pillow format, file extension)
+VARIANT_FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+VARIANT_QUALITY = 80
+
+
+def render_variants(data, widths=VARIANT_WIDTHS, quality=VARIANT_QUALITY):
+    """
+    Resize an encoded image to each of `widths` and encode every size in all
+    VARIANT_FORMATS. Bytes in, {(width, format): bytes} out, so it can run in a
+    worker process. Images are never upscaled: widths wider than the original
+    are skipped, except that the smallest width is always produced.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        source = ImageOps.exif_transpose(original)
+        if source.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha channel; flatten onto white for both formats
+            source = source.convert('RGBA')
+            background = Image.new('RGB', source.size, 'white')
+            background.paste(source, mask=source.getchannel('A'))
+            source = background
+        elif source.mode != 'RGB':
+            source = source.convert('RGB')
+
+        rendered = {}
+        for index, width in enumerate(sorted(widths)):
+            if width > source.width and index:
+                break
+            target_width = min(width, source.width)
+            height = max(1, round(source.height * target_width / source.width))
+            resized = source.resize((target_width, height), Image.Resampling.LANCZOS)
+            for key, (pil_format, _) in VARIANT_FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, pil_format, quality=quality)
+                rendered[(width, key)] = buffer.getvalue()
+        return rendered
+
+
+def variant_name(source, width, key):
+    """Storage name of a variant, next to its original: products/images/a.png -> products/images/a_160w.webp"""
+    root, _ = os.path.splitext(source)
+    return f'{root}_{width}w.{VARIANT_FORMATS[key][1]}'
+
+
+def variants_current(instance):
+    return bool(instance.image) and (instance.variants or {}).get('source') == instance.image.name
+
+
+def variant_names(instance):
+    """{width: {format: storage name}}, or None while the variants of the current image have not been generated yet"""
+    if not variants_current(instance):
+        return None
+    return instance.variants['sizes']
+
+
+def resolve_variant_urls(names, storage=None):
+    """Turn a variant_names() map into {width: {format: url}}"""
+    if names is None:
+        return None
+    return {
+        width: {key: media_url(name, storage) for key, name in formats.items()}
+        for width, formats in names.items()
+    }
+
+
+def variant_urls(instance):
+    """
+    {width: {format: url}} for the API, or None while the variants of the
+    current image have not been generated yet.
+    """
+    return resolve_variant_urls(variant_names(instance), instance.image.storage)
+
+
+# ============ GENERATION ============
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool shared by the whole worker, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the web process is multi-threaded
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                mp_context=get_context('spawn')
+            )
+        return _executor
+
+
+def _store_variants(instance, source, rendered):
+    storage = instance.image.storage
+    sizes = {}
+    for (width, key), content in rendered.items():
+        name = storage.save(variant_name(source, width, key), ContentFile(content))
+        sizes.setdefault(str(width), {})[key] = name
+
+    model = type(instance)
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(pk=instance.pk).first()
+        # The image was replaced (or the row deleted) meanwhile; its own job covers the new file
+        if current is None or current.image.name != source:
+            return False
+        current.variants = {'source': source, 'sizes': sizes}
+        current.save(update_fields=['variants'])
+    return True
+
+
+def generate_variants(refs, executor=None, force=False):
+    """
+    Generate and store variants for `refs`, an iterable of (model label, pk).
+    Originals are read here and resized in `executor` (in-process without one).
+    An image that can't be read or decoded is logged and skipped; it never
+    fails the save that queued it or the rest of the batch.
+    Returns the number of images processed.
+    """
+    jobs = []
+    for label, pk in refs:
+        instance = apps.get_model(label).objects.filter(pk=pk).first()
+        if instance is None or not instance.image or (variants_current(instance) and not force):
+            continue
+        source = instance.image.name
+        try:
+            with instance.image.storage.open(source, 'rb') as original:
+                data = original.read()
+            result = executor.submit(render_variants, data) if executor else render_variants(data)
+        except Exception:
+            logger.exception("Image variants failed for %s %s", label, pk)
+            continue
+        jobs.append((instance, source, result))
+
+    processed = 0
+    for instance, source, result in jobs:
+        try:
+            rendered = result.result() if executor else result
+            processed += _store_variants(instance, source, rendered)
+        except Exception:
+            logger.exception("Image variants failed for %s %s", instance._meta.label, instance.pk)
+    return processed
+
+
+# ============ BACKGROUND QUEUE ============
+
+_queue = queue.Queue()
+_worker_lock = threading.Lock()
+_worker_state = {'running': False}
+
+
+def _variant_worker():
+    try:
+        while True:
+            with _worker_lock:
+                if _queue.empty():
+                    _worker_state['running'] = False
+                    return
+            batch = []
+            while not _queue.empty() and len(batch) < 20:
+                batch.append(_queue.get())
+            try:
+                generate_variants(dict.fromkeys(batch), executor=get_executor())
+            except Exception:
+                logger.exception("Image variant batch failed")
+    finally:
+        connections.close_all()
+
+
+def schedule_image_variants(instance):
+    """
+    Generate variants for `instance` off the request path: originals are read
+    and written by a background thread, resizing runs in the process pool.
+    """
+    ref = (instance._meta.label, instance.pk)
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        generate_variants([ref])
+        return
+
+    with _worker_lock:
+        _queue.put(ref)
+        if _worker_state['running']:
+            return
+        _worker_state['running'] = True
+
+    threading.Thread(target=_variant_worker, name='image-variants', daemon=True).start()
@@ -0,0 +1,270 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+from .models import (
+    Products, ProductImage, ProductTag, ProductMaterial, ProductFeature,
+    ProductStockModel, SubCategoriesModel
+)
+from .signals import mark_products_dirty
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_BATCH_SIZE = 500
+# CSV cells holding several values: "summer|beach", stocks as "8:red:5|9:blue:0"
+LIST_SEPARATOR = '|'
+STOCK_SEPARATOR = ':'
+
+# Columns overwritten when an existing SKU is imported again
+UPDATE_FIELDS = ['productName', 'description', 'price', 'subCategories', 'discount', 'discountPerc', 'isActive', 'updatedAt']
+# Row key -> (child model, value column); a key present in a row replaces that collection
+CHILD_COLUMNS = {
+    'images': (ProductImage, 'image'),
+    'tags': (ProductTag, 'tag'),
+    'materials': (ProductMaterial, 'material'),
+    'keyFeatures': (ProductFeature, 'feature'),
+    'stocks': (ProductStockModel, None),
+}
+
+
+class ImportReport:
+    """Running totals of an import; errors are (line number, SKU, message)"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.image_ids = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+# ============ READING ============
+
+def _split(value):
+    return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(stream)
+    for raw in reader:
+        row = {key: value for key, value in raw.items() if key and value is not None}
+        for key in ('images', 'tags', 'materials', 'keyFeatures'):
+            if key in row:
+                row[key] = _split(row[key])
+        if 'stocks' in row:
+            stocks = []
+            for item in _split(row['stocks']):
+                size, _, rest = item.partition(STOCK_SEPARATOR)
+                color, _, quantity = rest.partition(STOCK_SEPARATOR)
+                stocks.append({'size': size, 'color': color, 'quantity': quantity})
+            row['stocks'] = stocks
+        yield reader.line_num, row
+
+
+def _jsonl_rows(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = exc
+        yield line_number, row
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or JSONL text stream without loading it whole"""
+    return _csv_rows(stream) if fmt == 'csv' else _jsonl_rows(stream)
+
+
+# ============ VALIDATION ============
+
+def _decimal(row, name, default=None):
+    value = row.get(name, default)
+    if value in (None, ''):
+        if default is None:
+            raise ValidationError(f'{name} is required')
+        value = default
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValidationError(f'{name} must be a number')
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n', '')
+
+
+def _subcategory_lookup():
+    """Subcategories by id and by name, loaded once per import"""
+    lookup = {}
+    for pk, name in SubCategoriesModel.objects.values_list('subCategoryId', 'name'):
+        lookup[str(pk)] = pk
+        lookup[name] = pk
+    return lookup
+
+
+def parse_row(row, subcategories):
+    """
+    Turn one input row into an unsaved Products instance plus
+    {child key: [unsaved child instances]}, raising ValidationError on bad data.
+    """
+    if not isinstance(row, dict):
+        raise ValidationError('Not a JSON object')
+
+    subcategory = str(row.get('subCategory', '')).strip()
+    if subcategory not in subcategories:
+        raise ValidationError(f'Unknown subCategory {subcategory!r}')
+
+    product = Products(
+        SKU=str(row.get('SKU', '')).strip(),
+        productName=str(row.get('productName', '')).strip(),
+        description=str(row.get('description', '')).strip(),
+        price=_decimal(row, 'price'),
+        discount=_decimal(row, 'discount', 0),
+        discountPerc=_decimal(row, 'discountPerc', 0),
+        isActive=_boolean(row.get('isActive', True)),
+        subCategories_id=subcategories[subcategory],
+    )
+    if not product.SKU:
+        raise ValidationError('SKU is required')
+    product.clean_fields(exclude=['subCategories'])
+
+    children = {}
+    for key, (model, column) in CHILD_COLUMNS.items():
+        if key not in row:
+            continue
+        if key == 'stocks':
+            items = [
+                model(size=stock.get('size'), color=str(stock.get('color', '')).strip(),
+                      quantity=stock.get('quantity') or 0)
+                for stock in row[key]
+            ]
+        else:
+            items = [model(**{column: value}) for value in row[key]]
+        for item in items:
+            item.clean_fields(exclude=['product'])
+        children[key] = items
+    return product, children
+
+
+def _error_message(exc):
+    if hasattr(exc, 'error_dict'):
+        return '; '.join(f'{field}: {" ".join(messages)}' for field, messages in exc.message_dict.items())
+    return '; '.join(exc.messages)
+
+
+# ============ WRITING ============
+
+def _write_batch(batch, report):
+    """Upsert one batch of (line, product, children) in a single transaction"""
+    skus = [product.SKU for _, product, _ in batch]
+    with transaction.atomic():
+        existing = set(Products.objects.filter(SKU__in=skus).values_list('SKU', flat=True))
+        Products.objects.bulk_create(
+            [product for _, product, _ in batch],
+            update_conflicts=True, unique_fields=['SKU'], update_fields=UPDATE_FIELDS
+        )
+        # Updated rows keep their productId, which the upsert doesn't hand back for UUID keys
+        product_ids = dict(Products.objects.filter(SKU__in=skus).values_list('SKU', 'pk'))
+        for _, product, _ in batch:
+            product.pk = product_ids[product.SKU]
+        product_ids = list(product_ids.values())
+
+        image_ids = []
+        for key, (model, _) in CHILD_COLUMNS.items():
+            replaced = [product.pk for _, product, children in batch if key in children]
+            if not replaced:
+                continue
+            # The whole batch is refreshed below
+            model.objects.filter(product_id__in=replaced).delete_without_signals()
+            rows = []
+            for _, product, children in batch:
+                for child in children.get(key, ()):
+                    child.product_id = product.pk
+                    rows.append(child)
+            created = model.objects.bulk_create(rows)
+            if model is ProductImage:
+                image_ids = [image.pk for image in created]
+
+        Products.objects.filter(pk__in=product_ids).refresh_stock_totals()
+        mark_products_dirty(product_ids)
+
+    report.created += len(set(skus) - existing)
+    report.updated += len(existing)
+    report.image_ids.extend(image_ids)
+
+
+def _flush(batch, report):
+    if not batch:
+        return
+    try:
+        _write_batch(batch, report)
+    except DatabaseError:
+        # Isolate the offending rows so the rest of the batch still lands
+        for item in batch:
+            try:
+                _write_batch([item], report)
+            except DatabaseError as exc:
+                report.errors.append((item[0], item[1].SKU, str(exc).strip()))
+    batch.clear()
+
+
+def import_catalog(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Upsert products by SKU from (line number, row) pairs, `batch_size` rows
+    per transaction. Invalid rows are recorded in the report and skipped.
+    `progress(report)` is called after every batch.
+    """
+    report = ImportReport()
+    subcategories = _subcategory_lookup()
+    batch = []
+    batch_skus = set()
+
+    for line_number, row in rows:
+        report.rows += 1
+        if isinstance(row, Exception):
+            report.errors.append((line_number, None, f'Invalid JSON: {row}'))
+            continue
+        try:
+            product, children = parse_row(row, subcategories)
+        except ValidationError as exc:
+            sku = row.get('SKU') if isinstance(row, dict) else None
+            report.errors.append((line_number, sku, _error_message(exc)))
+            continue
+
+        # A SKU repeated within one batch would make the upsert touch a row twice
+        if product.SKU in batch_skus:
+            _flush(batch, report)
+            batch_skus.clear()
+        batch.append((line_number, product, children))
+        batch_skus.add(product.SKU)
+
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch_skus.clear()
+            if progress:
+                progress(report)
+
+    _flush(batch, report)
+    if progress:
+        progress(report)
+    return report
@@ -0,0 +1,40 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from categories.media import media_url, public_base_url, clear_media_url_cache
+from categories.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Compare the per-image cost of storage.url() with categories.media.media_url()"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=100,
+                            help="Distinct image names per pass (taken from ProductImage, padded with synthetic names)")
+        parser.add_argument('--passes', type=int, default=10,
+                            help="Times each name is resolved, like repeated listing requests")
+
+    def handle(self, *args, **options):
+        names = list(ProductImage.objects.exclude(image='').values_list('image', flat=True)[:options['images']])
+        names += [f'products/images/benchmark-{i}.jpg' for i in range(options['images'] - len(names))]
+        calls = len(names) * options['passes']
+
+        def timed(resolve):
+            started = time.perf_counter()
+            for _ in range(options['passes']):
+                for name in names:
+                    resolve(name)
+            return (time.perf_counter() - started) / calls * 1e6
+
+        clear_media_url_cache()
+        storage_cost = timed(default_storage.url)
+        clear_media_url_cache()
+        media_cost = timed(media_url)
+
+        mode = f'public base {public_base_url()}' if public_base_url() else 'cached storage URLs'
+        self.stdout.write(f"{len(names)} images x {options['passes']} passes ({default_storage.__class__.__name__}, {mode})")
+        self.stdout.write(f"  storage.url(): {storage_cost:8.1f} us/image")
+        self.stdout.write(f"  media_url():   {media_cost:8.1f} us/image")
+        self.stdout.write(self.style.SUCCESS(f"  speedup:       {storage_cost / media_cost:8.1f}x"))
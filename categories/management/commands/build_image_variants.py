@@ -0,0 +1,33 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from categories.images import IMAGE_MODELS, generate_variants, get_executor
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for category, subcategory and product images that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that are already up to date")
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help="Originals read into memory and resized in parallel per round")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        executor = get_executor()
+        processed = 0
+        try:
+            for label in IMAGE_MODELS:
+                model = apps.get_model(label)
+                pks = list(model.objects.exclude(image='').values_list('pk', flat=True))
+                for start in range(0, len(pks), options['chunk_size']):
+                    chunk = [(label, pk) for pk in pks[start:start + options['chunk_size']]]
+                    processed += generate_variants(chunk, executor=executor, force=options['force'])
+        finally:
+            executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {processed} images in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,31 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from categories.export import iter_catalog_export, EXPORT_FORMATS, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Stream the full product catalog (with images, tags, materials, features and stock) to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="File to write to (default: stdout)")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Products fetched (and children prefetched) per round trip")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        target = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for piece in iter_catalog_export(options['format'], chunk_size=options['chunk_size']):
+                target.write(piece)
+        finally:
+            if options['output']:
+                target.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Catalog exported to {options['output']} in {time.monotonic() - started:.1f}s"
+            ))
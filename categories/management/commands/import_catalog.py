@@ -0,0 +1,68 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from categories.dashboard import rebuild_all_dashboards
+from categories.images import generate_variants, get_executor
+from categories.importer import import_catalog, read_rows, IMPORT_FORMATS, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert products by SKU from a CSV or JSONL file, with their images, tags, materials, "
+        "features and stock. A column/key present in a row replaces that collection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin")
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help="Input format (default: from the file extension)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows written per transaction")
+        parser.add_argument('--skip-variants', action='store_true',
+                            help="Don't generate image variants for imported images (run build_image_variants later)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            fmt = 'jsonl' if extension in ('jsonl', 'ndjson') else extension
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError(f"Can't tell the format of {path}; pass --format {'/'.join(IMPORT_FORMATS)}")
+
+        def progress(report):
+            self.stdout.write(
+                f"{report.rows} rows, {report.created} created, {report.updated} updated, "
+                f"{report.failed} failed ({report.rows_per_second:.0f} rows/s)"
+            )
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            report = import_catalog(read_rows(stream, fmt), batch_size=options['batch_size'], progress=progress)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for line_number, sku, message in report.errors:
+            self.stderr.write(f"line {line_number}{f' ({sku})' if sku else ''}: {message}")
+
+        if report.created or report.updated:
+            # Background rebuilds would die with this process
+            rebuild_all_dashboards()
+        if report.image_ids and not options['skip_variants']:
+            executor = get_executor()
+            try:
+                for start in range(0, len(report.image_ids), 50):
+                    chunk = report.image_ids[start:start + 50]
+                    generate_variants([('categories.ProductImage', pk) for pk in chunk], executor=executor)
+            finally:
+                executor.shutdown()
+
+        style = self.style.WARNING if report.failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Imported {report.rows - report.failed} of {report.rows} rows in {report.elapsed:.1f}s "
+            f"({report.rows_per_second:.0f} rows/s): {report.created} created, {report.updated} updated, "
+            f"{report.failed} failed"
+        ))
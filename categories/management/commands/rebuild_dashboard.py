@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from categories.dashboard import rebuild_all_dashboards, DashboardSnapshot
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed dashboard documents served by dashboardHome"
+
+    def handle(self, *args, **options):
+        rebuild_all_dashboards()
+        for snapshot in DashboardSnapshot.objects.order_by('key'):
+            payload = snapshot.payload
+            self.stdout.write(self.style.SUCCESS(
+                f"Dashboard {snapshot.key} rebuilt: {payload['totalCategories']} categories, "
+                f"{payload['totalSubcategories']} subcategories, {payload['totalProducts']} products"
+            ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from categories.facets import rebuild_all_facets
+from categories.models import ProductFacet, FacetCount
+
+
+class Command(BaseCommand):
+    help = "Recompute the product facet index and catalog-wide facet counts from scratch"
+
+    def handle(self, *args, **options):
+        rebuild_all_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f"Facet index rebuilt: {ProductFacet.objects.count()} product facets, "
+            f"{FacetCount.objects.count()} facet values"
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, JSONField, Q, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from categories.models import Products, STOCK_MATRIX_SQL
+
+
+class Command(BaseCommand):
+    help = "Find products whose stored totalStock or stockMatrix drifted from their variant rows and fix them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, don't repair it")
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Products.objects.annotate(
+                actualStock=Coalesce(Sum('stocks__quantity'), 0),
+                actualMatrix=RawSQL(STOCK_MATRIX_SQL, [], output_field=JSONField()),
+            )
+            .filter(~Q(totalStock=F('actualStock')) | ~Q(stockMatrix=F('actualMatrix')))
+            .values_list('pk', 'SKU', 'totalStock', 'actualStock', 'stockMatrix', 'actualMatrix')
+        )
+        for pk, sku, stored, actual, stored_matrix, actual_matrix in drifted:
+            if stored != actual:
+                self.stdout.write(f"{sku or pk}: stored {stored}, actual {actual}")
+            if stored_matrix != actual_matrix:
+                self.stdout.write(f"{sku or pk}: stored matrix {stored_matrix}, actual {actual_matrix}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("No stock drift found"))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} products drifted (dry run, nothing changed)"))
+            return
+
+        repaired = Products.objects.filter(pk__in=[row[0] for row in drifted]).refresh_stock_totals()
+        self.stdout.write(self.style.SUCCESS(f"Repaired stock totals on {repaired} products"))
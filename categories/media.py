@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.encoding import filepath_to_uri
+
+# How long a storage-generated (possibly presigned) URL is reused. Must stay
+# well below AWS_QUERYSTRING_EXPIRE so that handed-out links remain valid.
+URL_CACHE_TTL = getattr(settings, 'MEDIA_URL_CACHE_TTL', 1800)
+URL_CACHE_SIZE = getattr(settings, 'MEDIA_URL_CACHE_SIZE', 20000)
+
+_urls = OrderedDict()
+_urls_lock = threading.Lock()
+
+
+def public_base_url():
+    """Base URL that serves stored files as-is (CDN or public bucket), or '' if files need signing"""
+    base = getattr(settings, 'MEDIA_PUBLIC_BASE_URL', '')
+    if not base and getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', None):
+        base = f'https://{settings.AWS_S3_CUSTOM_DOMAIN}'
+    return base.rstrip('/')
+
+
+def _storage_url(name, storage):
+    now = time.monotonic()
+    key = (id(storage), name)
+    with _urls_lock:
+        cached = _urls.get(key)
+        if cached and cached[1] > now:
+            _urls.move_to_end(key)
+            return cached[0]
+
+    url = storage.url(name)
+    with _urls_lock:
+        _urls[key] = (url, now + URL_CACHE_TTL)
+        _urls.move_to_end(key)
+        while len(_urls) > URL_CACHE_SIZE:
+            _urls.popitem(last=False)
+    return url
+
+
+def media_url(file_or_name, storage=None):
+    """
+    URL of a stored file (a FieldFile or a storage name).
+
+    With MEDIA_PUBLIC_BASE_URL (or AWS_S3_CUSTOM_DOMAIN) configured the URL is
+    plain string formatting. Otherwise it comes from storage.url(), which
+    presigns on S3, and is cached for MEDIA_URL_CACHE_TTL seconds.
+    """
+    if not file_or_name:
+        return None
+    if isinstance(file_or_name, str):
+        name, storage = file_or_name, storage or default_storage
+    else:
+        name, storage = file_or_name.name, file_or_name.storage
+
+    base = public_base_url()
+    if base:
+        return f'{base}/{filepath_to_uri(name)}'
+    return _storage_url(name, storage)
+
+
+def url_window():
+    """
+    Start (epoch seconds) of the current signing window, or None when URLs
+    are unsigned. Responses that embed signed URLs fold this into their
+    validators so a client revalidating later gets fresh links, not a 304.
+    Windows are half the cache TTL: a URL may already be up to one TTL old
+    when handed out, so it is never kept past 1.5 TTLs.
+    """
+    if public_base_url():
+        return None
+    window = max(1, URL_CACHE_TTL // 2)
+    return int(time.time()) // window * window
+
+
+def clear_media_url_cache():
+    with _urls_lock:
+        _urls.clear()
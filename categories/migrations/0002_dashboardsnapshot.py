@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('payload', models.JSONField(default=dict)),
+                ('builtAt', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
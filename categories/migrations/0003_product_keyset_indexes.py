@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0002_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['price', 'productId'], name='product_price_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['totalSales', 'productId'], name='product_sales_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['createdAt', 'productId'], name='product_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['subCategories', 'price', 'productId'], name='product_sub_price_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['subCategories', 'totalSales', 'productId'], name='product_sub_sales_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['subCategories', 'createdAt', 'productId'], name='product_sub_created_keyset'),
+        ),
+    ]
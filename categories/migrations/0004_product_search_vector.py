@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+BACKFILL_SEARCH_VECTORS = """
+UPDATE categories_products p SET "searchVector" =
+    setweight(to_tsvector('english', p."productName"), 'A')
+    || setweight(to_tsvector('english', coalesce(
+        (SELECT string_agg(t.tag, ' ') FROM categories_producttag t WHERE t.product_id = p."productId"), '')), 'B')
+    || setweight(to_tsvector('english', coalesce(
+        (SELECT string_agg(m.material, ' ') FROM categories_productmaterial m WHERE m.product_id = p."productId"), '')), 'B')
+    || setweight(to_tsvector('english', coalesce(
+        (SELECT string_agg(f.feature, ' ') FROM categories_productfeature f WHERE f.product_id = p."productId"), '')), 'C')
+    || setweight(to_tsvector('english', p.description), 'D');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0003_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='searchVector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['searchVector'], name='product_search_gin'),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTORS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Mirrors categories.facets.compute_product_facets / PRICE_BUCKETS
+BACKFILL_FACETS = """
+INSERT INTO categories_productfacet (product_id, facet, value)
+SELECT "productId", 'subcategory', "subCategories_id"::text FROM categories_products
+UNION
+SELECT "productId", 'price', CASE
+    WHEN price < 500 THEN '0-500'
+    WHEN price < 1000 THEN '500-1000'
+    WHEN price < 2000 THEN '1000-2000'
+    WHEN price < 5000 THEN '2000-5000'
+    ELSE '5000+' END
+FROM categories_products
+UNION
+SELECT product_id, 'size', size::text FROM categories_productstockmodel WHERE quantity > 0
+UNION
+SELECT product_id, 'color', color FROM categories_productstockmodel WHERE quantity > 0
+UNION
+SELECT product_id, 'material', material FROM categories_productmaterial
+UNION
+SELECT product_id, 'tag', tag FROM categories_producttag;
+
+INSERT INTO categories_facetcount (facet, value, count)
+SELECT facet, value, count(*) FROM categories_productfacet GROUP BY facet, value;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('subcategory', 'Subcategory'), ('price', 'Price range'), ('size', 'Size'), ('color', 'Color'), ('material', 'Material'), ('tag', 'Tag')], max_length=20)),
+                ('value', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('subcategory', 'Subcategory'), ('price', 'Price range'), ('size', 'Size'), ('color', 'Color'), ('material', 'Material'), ('tag', 'Tag')], max_length=20)),
+                ('value', models.CharField(max_length=50)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='categories.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', 'value', 'product'], name='product_facet_lookup')],
+                'unique_together': {('product', 'facet', 'value')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_FACETS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+BACKFILL_TOTAL_STOCK = """
+UPDATE categories_products p SET "totalStock" = coalesce(
+    (SELECT sum(s.quantity) FROM categories_productstockmodel s WHERE s.product_id = p."productId"), 0);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0005_product_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='totalStock',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_TOTAL_STOCK, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0006_product_total_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('scope', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updatedAt', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
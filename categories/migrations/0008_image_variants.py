@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0007_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoriesmodel',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subcategoriesmodel',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
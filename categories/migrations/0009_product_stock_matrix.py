@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+BACKFILL_STOCK_MATRIX = """
+UPDATE categories_products p SET "stockMatrix" = coalesce((
+    SELECT jsonb_object_agg(sizes.size::text, sizes.colors) FROM (
+        SELECT v.size, jsonb_object_agg(v.color, v.quantity) AS colors FROM (
+            SELECT size, color, sum(quantity) AS quantity FROM categories_productstockmodel
+            WHERE product_id = p."productId" GROUP BY size, color
+        ) v GROUP BY v.size
+    ) sizes
+), '{}'::jsonb);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='stockMatrix',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_STOCK_MATRIX, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0009_product_stock_matrix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='sales30d',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='sales7d',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0010_product_sales_windows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='trendingScore',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['trendingScore', 'productId'], name='product_trending_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['subCategories', 'trendingScore', 'productId'], name='product_sub_trending_keyset'),
+        ),
+    ]
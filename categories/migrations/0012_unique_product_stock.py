@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:59
+
+from django.db import migrations
+
+# Fold duplicate variants into the oldest row, summing their quantities, so the
+# unique constraint can be added; totalStock and stockMatrix already sum them
+MERGE_DUPLICATE_STOCKS = """
+UPDATE categories_productstockmodel s SET quantity = d.quantity
+FROM (
+    SELECT min(id) AS id, sum(quantity) AS quantity FROM categories_productstockmodel
+    GROUP BY product_id, size, color HAVING count(*) > 1
+) d
+WHERE s.id = d.id;
+DELETE FROM categories_productstockmodel s
+USING categories_productstockmodel k
+WHERE s.product_id = k.product_id AND s.size = k.size AND s.color = k.color AND s.id > k.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0011_product_trending_score'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATE_STOCKS, reverse_sql=migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='productstockmodel',
+            unique_together={('product', 'size', 'color')},
+        ),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 import uuid
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 # Create your models here.
 
 
@@ -21,6 +26,8 @@ class CategoriesModel(models.Model):
         blank=False,
         null=False
     )
+    # Generated resized copies of `image`, see categories.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
 
@@ -48,6 +55,8 @@ class SubCategoriesModel(models.Model):
         blank=False,
         null=False
     )
+    # Generated resized copies of `image`, see categories.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
 
@@ -60,6 +69,36 @@ class SubCategoriesModel(models.Model):
         return self.name
 
 
+# {"size": {"color": quantity}} for the outer product row, built from its stock rows
+STOCK_MATRIX_SQL = """
+    COALESCE((
+        SELECT jsonb_object_agg(sizes.size::text, sizes.colors)
+        FROM (
+            SELECT variants.size, jsonb_object_agg(variants.color, variants.quantity) AS colors
+            FROM (
+                SELECT size, color, SUM(quantity) AS quantity
+                FROM categories_productstockmodel
+                WHERE product_id = categories_products."productId"
+                GROUP BY size, color
+            ) variants
+            GROUP BY variants.size
+        ) sizes
+    ), '{}'::jsonb)
+"""
+
+
+class ProductsQuerySet(models.QuerySet):
+    def refresh_stock_totals(self):
+        """Recompute the denormalized totalStock and stockMatrix columns from the ProductStockModel rows"""
+        stock = ProductStockModel.objects.filter(product=OuterRef('pk')).values('product').annotate(
+            total=Sum('quantity')
+        ).values('total')
+        return self.update(
+            totalStock=Coalesce(Subquery(stock), 0),
+            stockMatrix=RawSQL(STOCK_MATRIX_SQL, [], output_field=models.JSONField()),
+        )
+
+
 class Products(models.Model):
     productId = models.UUIDField(primary_key=True,
         default=uuid.uuid4,
@@ -74,9 +113,38 @@ class Products(models.Model):
     discount = models.DecimalField(max_digits=10, decimal_places=2)
     discountPerc = models.DecimalField(max_digits=5, decimal_places=2)
     totalSales = models.IntegerField(default=0)
+    # Units sold in paid orders over the last 7/30 days, see transactions.sales
+    sales7d = models.IntegerField(default=0, editable=False)
+    sales30d = models.IntegerField(default=0, editable=False)
+    # Time-decayed recent sales, recomputed periodically by transactions.trending
+    trendingScore = models.FloatField(default=0, editable=False)
+    # Sum of all variant quantities, kept in step with ProductStockModel writes
+    totalStock = models.IntegerField(default=0, editable=False)
+    # Variant quantities as {"size": {"color": quantity}}, kept in step with totalStock
+    stockMatrix = models.JSONField(default=dict, editable=False)
     isActive = models.BooleanField(default=True)
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
+    # Weighted tsvector over name, tags, materials, features and description,
+    # maintained by categories.search
+    searchVector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductsQuerySet.as_manager()
+
+    class Meta:
+        # Composite (sort key, productId) indexes backing keyset pagination,
+        # both catalog-wide and within a subcategory
+        indexes = [
+            models.Index(fields=['price', 'productId'], name='product_price_keyset'),
+            models.Index(fields=['totalSales', 'productId'], name='product_sales_keyset'),
+            models.Index(fields=['createdAt', 'productId'], name='product_created_keyset'),
+            models.Index(fields=['trendingScore', 'productId'], name='product_trending_keyset'),
+            models.Index(fields=['subCategories', 'price', 'productId'], name='product_sub_price_keyset'),
+            models.Index(fields=['subCategories', 'totalSales', 'productId'], name='product_sub_sales_keyset'),
+            models.Index(fields=['subCategories', 'createdAt', 'productId'], name='product_sub_created_keyset'),
+            models.Index(fields=['subCategories', 'trendingScore', 'productId'], name='product_sub_trending_keyset'),
+            GinIndex(fields=['searchVector'], name='product_search_gin'),
+        ]
 
     def __str__(self):
         return self.productName
@@ -84,7 +152,7 @@ class Products(models.Model):
     @property
     def total_stock(self):
         """Get total stock across all sizes and colors"""
-        return self.stocks.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.totalStock
 
     @property
     def discounted_price(self):
@@ -99,27 +167,40 @@ class Products(models.Model):
         """Check if product has enough stock for specific size/color or total"""
         if size is not None and color is not None:
             # Check stock for specific variant
-            try:
-                stock_item = self.stocks.get(size=size, color=color)
-                return stock_item.quantity >= quantity
-            except:
-                return False
+            return self.get_variant_stock(size, color) >= quantity
         else:
             # Check total stock across all variants
             return self.total_stock >= quantity
 
     def get_variant_stock(self, size, color):
         """Get stock quantity for specific size/color variant"""
-        try:
-            stock_item = self.stocks.get(size=size, color=color)
-            return stock_item.quantity
-        except:
-            return 0
+        return self.stockMatrix.get(str(size), {}).get(color, 0)
+
+
+class ChildRowQuerySet(models.QuerySet):
+    """QuerySet for leaf tables (product children, cart lines) that bulk writers rewrite wholesale"""
+
+    def delete_without_signals(self):
+        """
+        Delete the rows with one plain DELETE: no pre/post_delete signals and
+        no Django-side cascade. For bulk writers that refresh the derived data
+        (search vectors, facets, stock or cart totals) once themselves, where
+        per-row signals would refresh it row by row. Refused for models that
+        other tables reference, since their cascade would be skipped silently.
+        """
+        if self.model._meta.related_objects:
+            raise TypeError(f'{self.model.__name__} rows are referenced elsewhere; use delete()')
+        return self._raw_delete(self.db)
 
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/images/')
+    # Generated resized copies of `image`, see categories.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+
+    objects = ChildRowQuerySet.as_manager()
 
     def __str__(self):
         return f"Image for {self.product.productName}"
@@ -129,6 +210,9 @@ class ProductTag(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='tags')
     tag = models.CharField(max_length=50)
 
+
+    objects = ChildRowQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.tag} (Product: {self.product.productName})"
 
@@ -137,6 +221,9 @@ class ProductMaterial(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='materials')
     material = models.CharField(max_length=50)
 
+
+    objects = ChildRowQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.material} (Product: {self.product.productName})"
 
@@ -145,19 +232,120 @@ class ProductFeature(models.Model):
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='keyFeatures')
     feature = models.CharField(max_length=50)
 
+
+    objects = ChildRowQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.feature} (Product: {self.product.productName})"
 
 
+class ProductStockQuerySet(ChildRowQuerySet):
+    """
+    Bulk writes skip model signals, so do what the per-row stock signals do
+    here instead: refresh the stock totals of the affected products inside
+    the same transaction, and queue their size/color facets and a catalog
+    version bump for after commit. bulk_update() needs no override: it
+    writes through update() below.
+    """
+
+    def _stock_written(self, product_ids):
+        # categories.signals imports this module
+        from .signals import mark_products_dirty
+        if product_ids:
+            Products.objects.filter(pk__in=product_ids).refresh_stock_totals()
+            mark_products_dirty(product_ids, ('facets',))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            self._stock_written({obj.product_id for obj in objs})
+        return created
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            product_ids = set(self.values_list('product_id', flat=True))
+            moved_to = kwargs.get('product_id', kwargs.get('product'))
+            if moved_to is not None and not hasattr(moved_to, 'resolve_expression'):
+                product_ids.add(getattr(moved_to, 'pk', moved_to))
+            updated = super().update(**kwargs)
+            if hasattr(moved_to, 'resolve_expression'):
+                # bulk_update() moving rows: a CASE per row, so read where they went
+                product_ids.update(self.values_list('product_id', flat=True))
+            self._stock_written(product_ids)
+        return updated
+
+
 class ProductStockModel(models.Model):
     size = models.IntegerField(blank=False)
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='stocks')
     quantity = models.IntegerField(blank=False, default=0)
     color = models.CharField(max_length=9)
 
+    objects = ProductStockQuerySet.as_manager()
+
+    class Meta:
+        # One row per variant; stock writes address rows by (product, size, color)
+        unique_together = ('product', 'size', 'color')
+
     def __str__(self):
         return f"(Product: {self.product.productName})"
 
 
+class CatalogVersion(models.Model):
+    """Counter bumped after every committed catalog write; cheap stamp for ETags and caches"""
+    scope = models.CharField(max_length=30, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+
+class DashboardSnapshot(models.Model):
+    """Precomputed dashboard payload, rebuilt whenever the catalog changes"""
+    key = models.CharField(max_length=50, primary_key=True)
+    payload = models.JSONField(default=dict)
+    builtAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard snapshot ({self.key})"
+
+
+FACET_CHOICES = (
+    ('subcategory', 'Subcategory'),
+    ('price', 'Price range'),
+    ('size', 'Size'),
+    ('color', 'Color'),
+    ('material', 'Material'),
+    ('tag', 'Tag'),
+)
 
 
+class ProductFacet(models.Model):
+    """One (facet, value) pair a product can be filtered by; maintained by categories.facets"""
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = ('product', 'facet', 'value')
+        indexes = [
+            models.Index(fields=['facet', 'value', 'product'], name='product_facet_lookup'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value} (Product: {self.product_id})"
+
+
+class FacetCount(models.Model):
+    """Catalog-wide number of products per (facet, value), kept in step with ProductFacet"""
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
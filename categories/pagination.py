@@ -0,0 +1,168 @@
+import base64
+import json
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.db.models import FloatField, Q
+
+from .models import Products
+
+
+class ProductKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over (sort key, productId).
+
+    Every page is fetched with a `WHERE (key, productId) > (last key, last id)`
+    style predicate backed by a composite index, so page 500 costs the same as
+    page 1. Cursors are opaque base64 tokens; clients just follow next/previous.
+
+    Query params:
+        sort      - price, totalSales, trendingScore or createdAt, prefixed with '-' for descending
+        page_size - items per page (default 20, max 100)
+        cursor    - token taken from a previous response
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    sort_query_param = 'sort'
+    sort_fields = ('price', 'totalSales', 'trendingScore', 'createdAt')
+    default_sort = '-createdAt'
+    tiebreak_field = 'productId'
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_sort_message = 'Invalid sort. Choose one of: {choices}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.sort = self.get_sort(request)
+        self.field = self.sort.lstrip('-')
+        descending = self.sort.startswith('-')
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        # Walking backwards is the same scan in the opposite direction
+        scan_descending = descending != reverse
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(cursor, scan_descending))
+
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}{self.tiebreak_field}')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    # ============ PARAMETERS ============
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_sort(self, request):
+        sort = request.query_params.get(self.sort_query_param, self.default_sort)
+        if sort.lstrip('-') not in self.sort_fields:
+            choices = ', '.join(self.sort_fields)
+            raise ValidationError({self.sort_query_param: self.invalid_sort_message.format(choices=choices)})
+        return sort
+
+    def keyset_filter(self, cursor, descending):
+        lookup = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field}__{lookup}': cursor['v']}) |
+            Q(**{self.field: cursor['v'], f'{self.tiebreak_field}__{lookup}': cursor['id']})
+        )
+
+    # ============ CURSORS ============
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if raw['s'] != self.sort:
+                raise ValueError('cursor belongs to a different sort order')
+            model_field = self.model_field(self.field)
+            return {
+                'v': model_field.to_python(raw['v']),
+                'id': self.model_field(self.tiebreak_field).to_python(raw['id']),
+                'r': bool(raw.get('r')),
+            }
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field)
+        raw = {
+            's': self.sort,
+            'v': value.isoformat() if isinstance(value, datetime) else str(value),
+            'id': str(getattr(instance, self.tiebreak_field)),
+            'r': int(reverse),
+        }
+        token = base64.urlsafe_b64encode(json.dumps(raw, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def model_field(self, name):
+        return Products._meta.get_field(name)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class SearchKeysetPagination(ProductKeysetPagination):
+    """Keyset pagination over (searchScore, productId), best matches first"""
+    sort_fields = ('searchScore',)
+    default_sort = '-searchScore'
+
+    def model_field(self, name):
+        if name == 'searchScore':
+            return FloatField()
+        return super().model_field(name)
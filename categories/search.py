@@ -0,0 +1,54 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, FloatField, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Ln
+
+from .models import Products, ProductTag, ProductMaterial, ProductFeature
+
+SEARCH_CONFIG = 'english'
+# How strongly lifetime sales lift a text match: score = rank * (1 + w * ln(1 + totalSales))
+SALES_WEIGHT = 0.1
+
+
+def _joined_children(model, column):
+    """All of a product's child values as one space separated string"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(product=OuterRef('pk'))
+            .values('product')
+            .annotate(joined=StringAgg(column, delimiter=' '))
+            .values('joined'),
+            output_field=TextField()
+        ),
+        Value(''),
+        output_field=TextField()
+    )
+
+
+def product_search_vector():
+    return (
+        SearchVector('productName', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_joined_children(ProductTag, 'tag'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_joined_children(ProductMaterial, 'material'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_joined_children(ProductFeature, 'feature'), weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(product_ids=None):
+    """Recompute searchVector for the given products (all products if None)"""
+    products = Products.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.update(searchVector=product_search_vector())
+
+
+def search_products(queryset, text):
+    """Filter `queryset` to products matching `text`, annotated with searchScore"""
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    score = SearchRank(F('searchVector'), query) * (
+        Value(1.0) + Value(SALES_WEIGHT) * Ln(Value(1.0) + Cast('totalSales', FloatField()))
+    )
+    return queryset.filter(searchVector=query).annotate(
+        searchScore=Cast(score, FloatField())
+    )
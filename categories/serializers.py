@@ -1,17 +1,40 @@
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 from .models import CategoriesModel, SubCategoriesModel
 from .models import Products, ProductImage, ProductTag, ProductMaterial, ProductFeature, ProductStockModel
+from .images import variant_urls, schedule_image_variants
+from .media import media_url
+from .stock import MAX_ADJUSTMENTS
+
+
+class MediaImageField(serializers.ImageField):
+    """ImageField whose URLs come from categories.media instead of storage.url()"""
+
+    def to_representation(self, value):
+        url = media_url(value)
+        if url is None:
+            return None
+        request = self.context.get('request', None)
+        if request is not None and url.startswith('/'):
+            return request.build_absolute_uri(url)
+        return url
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(use_url=True)
+    image = MediaImageField()
+    variants = serializers.SerializerMethodField()
     class Meta:
         model = CategoriesModel
         fields = '__all__'
 
+    def get_variants(self, obj):
+        return variant_urls(obj)
+
 
 class SubCategorySerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(use_url=True)
+    image = MediaImageField()
+    variants = serializers.SerializerMethodField()
     categories = serializers.PrimaryKeyRelatedField(queryset=CategoriesModel.objects.all())
     name = serializers.CharField(max_length=50)
     collectionName = serializers.CharField(max_length=30)
@@ -20,11 +43,21 @@ class SubCategorySerializer(serializers.ModelSerializer):
         model = SubCategoriesModel
         fields = '__all__'
 
+    def get_variants(self, obj):
+        return variant_urls(obj)
+
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image = MediaImageField()
+    # {width: {'webp': url, 'jpeg': url}}; null until the variants are generated
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
+
+    def get_variants(self, obj):
+        return variant_urls(obj)
 
 
 class ProductTagSerializer(serializers.ModelSerializer):
@@ -65,26 +98,204 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Products
-        fields = '__all__'
+        # searchVector is internal search index state
+        exclude = ['searchVector']
 
-    def create(self, validated_data):
-        images_data = validated_data.pop('images', [])
-        tags_data = validated_data.pop('tags', [])
-        materials_data = validated_data.pop('materials', [])
-        features_data = validated_data.pop('keyFeatures', [])
-        stocks_data = validated_data.pop('stocks', [])
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, see ProductFieldSelection
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    # Nested collection -> (model, columns identifying a row when diffing).
+    # Images have none: an upload never compares equal to a stored file name,
+    # so a diff update that includes images always replaces them.
+    child_models = {
+        'images': (ProductImage, None),
+        'tags': (ProductTag, ('tag',)),
+        'materials': (ProductMaterial, ('material',)),
+        'keyFeatures': (ProductFeature, ('feature',)),
+        'stocks': (ProductStockModel, ('size', 'color')),
+    }
+    # How update() treats a nested collection that is present in the payload:
+    # 'replace' swaps all rows, 'diff' keeps matching rows and only writes the changes
+    CHILDREN_MODES = ('replace', 'diff')
+
+    def validate_stocks(self, stocks):
+        variants = [(stock['size'], stock['color']) for stock in stocks]
+        if len(set(variants)) != len(variants):
+            raise ValidationError("Each size and color combination can only appear once.")
+        return stocks
 
+    def _pop_children(self, validated_data):
+        return {
+            key: validated_data.pop(key)
+            for key in self.child_models if key in validated_data
+        }
+
+    def _insert_children(self, product, key, items):
+        """One INSERT for a whole collection"""
+        model, _ = self.child_models[key]
+        created = model.objects.bulk_create([model(product=product, **item) for item in items])
+        if model is ProductImage:
+            # bulk_create skips post_save, which is what normally queues the variants
+            transaction.on_commit(lambda: [schedule_image_variants(image) for image in created])
+
+    def _replace_children(self, product, key, items):
+        model, _ = self.child_models[key]
+        # The product save in update() refreshes derived data once
+        model.objects.filter(product=product).delete_without_signals()
+        if items:
+            self._insert_children(product, key, items)
+
+    def _diff_children(self, product, key, items):
+        model, natural_key = self.child_models[key]
+        if natural_key is None:
+            return self._replace_children(product, key, items)
+
+        existing, stale = {}, []
+        for row in model.objects.filter(product=product).order_by('pk'):
+            row_key = tuple(str(getattr(row, column)) for column in natural_key)
+            # Rows repeating a key are dropped; the oldest one is kept and updated
+            if row_key in existing:
+                stale.append(row.pk)
+            else:
+                existing[row_key] = row
+        incoming = {tuple(str(item[column]) for column in natural_key): item for item in items}
+
+        stale += [row.pk for row_key, row in existing.items() if row_key not in incoming]
+        if stale:
+            model.objects.filter(pk__in=stale).delete_without_signals()
+
+        changed = []
+        for row_key, item in incoming.items():
+            row = existing.get(row_key)
+            if row is None:
+                continue
+            updates = {column: value for column, value in item.items() if getattr(row, column) != value}
+            if updates:
+                for column, value in updates.items():
+                    setattr(row, column, value)
+                changed.append(row)
+        if changed:
+            model.objects.bulk_update(changed, [column for column in items[0] if column not in natural_key])
+
+        added = [item for row_key, item in incoming.items() if row_key not in existing]
+        if added:
+            self._insert_children(product, key, added)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        children = self._pop_children(validated_data)
         product = Products.objects.create(**validated_data)
+        for key, items in children.items():
+            if items:
+                self._insert_children(product, key, items)
+        if children.get('stocks'):
+            product.refresh_from_db(fields=['totalStock', 'stockMatrix'])
+        return product
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """
+        Update the product and every nested collection present in the payload.
+        The mode comes from context['children_mode'] (default 'replace').
+        """
+        mode = self.context.get('children_mode', 'replace')
+        children = self._pop_children(validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Always saved: it stamps updatedAt and queues the search/facet refresh for the children too
+        instance.save()
+
+        write = self._diff_children if mode == 'diff' else self._replace_children
+        for key, items in children.items():
+            write(instance, key, items)
+        if 'stocks' in children:
+            Products.objects.filter(pk=instance.pk).refresh_stock_totals()
+            instance.refresh_from_db(fields=['totalStock', 'stockMatrix'])
+        return instance
+
+
+class ProductBatchLookupSerializer(serializers.Serializer):
+    """Either productIds or skus, up to MAX_ITEMS of them"""
+    MAX_ITEMS = 500
+
+    productIds = serializers.ListField(
+        child=serializers.UUIDField(), required=False, allow_empty=False, max_length=MAX_ITEMS
+    )
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False, allow_empty=False, max_length=MAX_ITEMS
+    )
+
+    def validate(self, attrs):
+        if ('productIds' in attrs) == ('skus' in attrs):
+            raise serializers.ValidationError("Provide exactly one of productIds or skus.")
+        return attrs
+
+
+class StockAdjustmentBatchSerializer(serializers.Serializer):
+    """Envelope only; items are checked one by one in categories.stock so a bad one can't sink the batch"""
+    adjustments = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_ADJUSTMENTS
+    )
+
+
+class ProductFieldSelection:
+    """
+    Sparse fieldsets for product reads.
+
+    ?fields=productName,price   scalar fields to return (productId is always included)
+    ?expand=images,stocks       nested collections to return
+
+    With neither parameter the full product is returned, as before. Once either
+    is given, only what was asked for is rendered, and the queryset is narrowed
+    to match: unused columns are deferred with only() and only the expanded
+    child tables are prefetched.
+    """
+    children = ('images', 'tags', 'materials', 'keyFeatures', 'stocks')
+    # Cheap columns always loaded so keyset cursors never hit deferred fields
+    sort_columns = ('price', 'totalSales', 'trendingScore', 'createdAt')
+
+    def __init__(self, fields=None, expand=None):
+        scalars = [
+            name for name in ProductSerializer().fields
+            if name not in self.children
+        ]
+        if fields is None and expand is None:
+            self.scalars = scalars
+            self.expand = list(self.children)
+            return
+
+        unknown = [name for name in (fields or []) if name not in scalars]
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+        unknown = [name for name in (expand or []) if name not in self.children]
+        if unknown:
+            raise ValidationError({'expand': f"Unknown relations: {', '.join(unknown)}"})
+
+        self.scalars = scalars if fields is None else ['productId'] + [f for f in fields if f != 'productId']
+        self.expand = list(expand or [])
+
+    @classmethod
+    def from_request(cls, request):
+        def split(param):
+            value = request.query_params.get(param)
+            if value is None:
+                return None
+            return [name.strip() for name in value.split(',') if name.strip()]
+        return cls(fields=split('fields'), expand=split('expand'))
+
+    @property
+    def serializer_fields(self):
+        return self.scalars + self.expand
+
+    def apply(self, queryset, extra_columns=()):
+        """Restrict the columns and prefetches of a Products queryset"""
+        columns = dict.fromkeys(self.scalars + list(self.sort_columns) + list(extra_columns))
+        return queryset.only(*columns).prefetch_related(*self.expand)
 
-        for image in images_data:
-            ProductImage.objects.create(product=product, **image)
-        for tag in tags_data:
-            ProductTag.objects.create(product=product, **tag)
-        for material in materials_data:
-            ProductMaterial.objects.create(product=product, **material)
-        for feature in features_data:
-            ProductFeature.objects.create(product=product, **feature)
-        for stock in stocks_data:
-            ProductStockModel.objects.create(product=product, **stock)
-
-        return product
\ No newline at end of file
+    def serializer(self, instance, **kwargs):
+        return ProductSerializer(instance, fields=self.serializer_fields, **kwargs)
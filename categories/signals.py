@@ -0,0 +1,147 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+
+from .models import (
+    CategoriesModel, SubCategoriesModel, Products, ProductImage,
+    ProductTag, ProductMaterial, ProductFeature, ProductStockModel
+)
+from .dashboard import schedule_dashboard_rebuild
+from .versioning import bump_catalog_version, SALES_SCOPE
+from .search import refresh_search_vectors
+from .facets import refresh_product_facets, removed_facet_deltas, forget_product_facets
+from .images import variants_current, schedule_image_variants
+
+# Every model whose rows end up in the dashboard document
+DASHBOARD_SOURCES = (
+    CategoriesModel, SubCategoriesModel, Products, ProductImage,
+    ProductTag, ProductMaterial, ProductFeature, ProductStockModel,
+)
+# Per-product derived data, refreshed after commit for every dirty product
+PRODUCT_REFRESHERS = {
+    'search': refresh_search_vectors,
+    'facets': refresh_product_facets,
+}
+# Child tables feeding each kind of derived data
+CHILD_SOURCES = {
+    ProductTag: ('search', 'facets'),
+    ProductMaterial: ('search', 'facets'),
+    ProductFeature: ('search',),
+    ProductStockModel: ('facets',),
+}
+# Models whose `image` gets resized variants
+IMAGE_SOURCES = (CategoriesModel, SubCategoriesModel, ProductImage)
+
+_pending = threading.local()
+
+
+def mark_products_dirty(product_ids, aspects=tuple(PRODUCT_REFRESHERS)):
+    """
+    Queue per-product derived data (search vectors, facet index) for a refresh
+    once the surrounding transaction commits. An admin save touching a product
+    and all of its inlines results in a single refresh per product.
+    Bulk writers that bypass model signals should call this directly.
+    """
+    if not hasattr(_pending, 'product_ids'):
+        _pending.product_ids = {aspect: set() for aspect in PRODUCT_REFRESHERS}
+    for aspect in aspects:
+        _pending.product_ids[aspect].update(product_ids)
+    transaction.on_commit(_flush_dirty_products)
+    mark_catalog_changed()
+
+
+def _flush_dirty_products():
+    pending = getattr(_pending, 'product_ids', None)
+    if not pending:
+        return
+    _pending.product_ids = {aspect: set() for aspect in PRODUCT_REFRESHERS}
+    for aspect, product_ids in pending.items():
+        if product_ids:
+            PRODUCT_REFRESHERS[aspect](product_ids)
+
+
+def mark_catalog_changed():
+    """
+    Bump the catalog version and rebuild the dashboard once the surrounding
+    transaction commits, however many rows it touched.
+    """
+    _pending.catalog_changed = True
+    transaction.on_commit(_flush_catalog_changed)
+
+
+def _flush_catalog_changed():
+    if not getattr(_pending, 'catalog_changed', False):
+        return
+    _pending.catalog_changed = False
+    bump_catalog_version()
+    schedule_dashboard_rebuild()
+
+
+def mark_sales_changed():
+    """
+    Bump the sales version once the surrounding transaction commits. Catalog
+    ETags and caches are left alone; dashboard snapshots built before the
+    bump refresh themselves on read, at most every DASHBOARD_SALES_REFRESH.
+    """
+    _pending.sales_changed = True
+    transaction.on_commit(_flush_sales_changed)
+
+
+def _flush_sales_changed():
+    if not getattr(_pending, 'sales_changed', False):
+        return
+    _pending.sales_changed = False
+    bump_catalog_version(SALES_SCOPE)
+
+
+def catalog_changed(sender, **kwargs):
+    mark_catalog_changed()
+
+
+def product_saved(sender, instance, **kwargs):
+    mark_products_dirty([instance.pk])
+
+
+def stock_changed(sender, instance, **kwargs):
+    """Keep Products.totalStock exact inside the same transaction as the stock write"""
+    Products.objects.filter(pk=instance.product_id).refresh_stock_totals()
+
+
+def product_deleting(sender, instance, **kwargs):
+    # Only read here; the counts change in post_delete, inside the same
+    # atomic block as the delete, so a delete that fails leaves them alone
+    instance._removed_facets = removed_facet_deltas([instance.pk])
+
+
+def product_deleted(sender, instance, **kwargs):
+    deltas = instance.__dict__.pop('_removed_facets', None)
+    if deltas:
+        forget_product_facets(deltas)
+
+
+def product_child_changed(sender, instance, **kwargs):
+    mark_products_dirty([instance.product_id], CHILD_SOURCES[sender])
+
+
+def image_saved(sender, instance, **kwargs):
+    if instance.image and not variants_current(instance):
+        transaction.on_commit(lambda: schedule_image_variants(instance))
+
+
+for model in DASHBOARD_SOURCES:
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_save_{model.__name__}')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_delete_{model.__name__}')
+
+post_save.connect(product_saved, sender=Products, dispatch_uid='product_saved')
+pre_delete.connect(product_deleting, sender=Products, dispatch_uid='product_deleting')
+post_delete.connect(product_deleted, sender=Products, dispatch_uid='product_deleted')
+post_save.connect(stock_changed, sender=ProductStockModel, dispatch_uid='stock_changed_save')
+post_delete.connect(stock_changed, sender=ProductStockModel, dispatch_uid='stock_changed_delete')
+
+for model in CHILD_SOURCES:
+    post_save.connect(product_child_changed, sender=model, dispatch_uid=f'product_child_save_{model.__name__}')
+    post_delete.connect(product_child_changed, sender=model, dispatch_uid=f'product_child_delete_{model.__name__}')
+
+for model in IMAGE_SOURCES:
+    post_save.connect(image_saved, sender=model, dispatch_uid=f'image_saved_{model.__name__}')
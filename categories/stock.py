@@ -0,0 +1,148 @@
+import uuid
+from collections import OrderedDict
+
+from django.db import connection, transaction
+
+from .models import Products, ProductStockModel
+from .signals import mark_products_dirty
+
+MAX_ADJUSTMENTS = 50000
+# Variants per UPDATE statement; all chunks share one transaction
+STATEMENT_SIZE = 5000
+
+UPDATED = 'updated'
+INSUFFICIENT = 'insufficient_stock'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+OUTCOMES = (UPDATED, INSUFFICIENT, NOT_FOUND, INVALID)
+
+
+def _integer(item, name):
+    value = item.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'{name} must be an integer')
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+
+
+def parse_adjustment(item):
+    """
+    Validate one {productId | SKU, size, color, delta | quantity} entry.
+    Returns (productId or None, SKU or None, size, color, absolute or None, delta).
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Expected an object')
+    if ('productId' in item) == ('SKU' in item):
+        raise ValueError('Provide exactly one of productId or SKU')
+    if ('delta' in item) == ('quantity' in item):
+        raise ValueError('Provide exactly one of delta or quantity')
+
+    product_id = sku = None
+    if 'productId' in item:
+        try:
+            product_id = uuid.UUID(str(item['productId']))
+        except ValueError:
+            raise ValueError('productId must be a UUID')
+    else:
+        sku = str(item['SKU'])
+
+    color = str(item.get('color', '')).strip()
+    if not color or len(color) > ProductStockModel._meta.get_field('color').max_length:
+        raise ValueError('color is required (at most 9 characters)')
+
+    size = _integer(item, 'size')
+    if 'quantity' in item:
+        absolute = _integer(item, 'quantity')
+        if absolute < 0:
+            raise ValueError('quantity must not be negative')
+        return product_id, sku, size, color, absolute, 0
+    return product_id, sku, size, color, None, _integer(item, 'delta')
+
+
+def _update_statement(rows):
+    table = connection.ops.quote_name(ProductStockModel._meta.db_table)
+    values = ', '.join(['(%s::integer, %s::uuid, %s::integer, %s::varchar, %s::integer, %s::integer)'] * len(rows))
+    # The data-modifying CTE applies every change in one pass; the outer query
+    # reports, for each variant, the new quantity or why it was left alone
+    # (it still sees the pre-update rows, i.e. the current quantity).
+    sql = f'''
+        WITH v (idx, product_id, size, color, absolute, delta) AS (VALUES {values}),
+        changed AS (
+            UPDATE {table} AS s
+            SET quantity = COALESCE(v.absolute, s.quantity) + v.delta
+            FROM v
+            WHERE s.product_id = v.product_id AND s.size = v.size AND s.color = v.color
+              AND COALESCE(v.absolute, s.quantity) + v.delta >= 0
+            RETURNING v.idx, s.product_id, s.quantity
+        )
+        SELECT v.idx, c.product_id, c.quantity, s.quantity
+        FROM v
+        LEFT JOIN changed c ON c.idx = v.idx
+        LEFT JOIN {table} s ON s.product_id = v.product_id AND s.size = v.size AND s.color = v.color
+    '''
+    params = [value for row in rows for value in row]
+    return sql, params
+
+
+@transaction.atomic
+def apply_stock_adjustments(items):
+    """
+    Apply a batch of stock changes and return one outcome per item, in order:
+    {'index', 'status', 'quantity'} plus 'error' for invalid items.
+
+    `delta` adds to the current quantity, `quantity` sets it. Changes to the
+    same variant are folded in order into one. A change that would take a
+    variant below zero is skipped (checked against the locked row, so it holds
+    under concurrent writers).
+    """
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, parse_adjustment(item)))
+        except ValueError as exc:
+            results[index] = {'index': index, 'status': INVALID, 'quantity': None, 'error': str(exc)}
+
+    skus = {adjustment[1] for _, adjustment in parsed if adjustment[1] is not None}
+    product_ids = dict(Products.objects.filter(SKU__in=skus).values_list('SKU', 'pk')) if skus else {}
+
+    # (productId, size, color) -> [absolute, delta, item indexes]
+    variants = OrderedDict()
+    for index, (product_id, sku, size, color, absolute, delta) in parsed:
+        product_id = product_id or product_ids.get(sku)
+        if product_id is None:
+            results[index] = {'index': index, 'status': NOT_FOUND, 'quantity': None}
+            continue
+        change = variants.setdefault((product_id, size, color), [None, 0, []])
+        if absolute is not None:
+            change[0], change[1] = absolute, 0
+        change[1] += delta
+        change[2].append(index)
+
+    rows = [
+        (position, product_id, size, color, absolute, delta)
+        for position, ((product_id, size, color), (absolute, delta, _)) in enumerate(variants.items())
+    ]
+    changes = list(variants.values())
+    touched = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), STATEMENT_SIZE):
+            cursor.execute(*_update_statement(rows[start:start + STATEMENT_SIZE]))
+            for position, product_id, new_quantity, current in cursor.fetchall():
+                if product_id is not None:
+                    touched.add(product_id)
+                    outcome = {'status': UPDATED, 'quantity': new_quantity}
+                elif current is not None:
+                    outcome = {'status': INSUFFICIENT, 'quantity': current}
+                else:
+                    outcome = {'status': NOT_FOUND, 'quantity': None}
+                for index in changes[position][2]:
+                    results[index] = {'index': index, **outcome}
+
+    if touched:
+        # Raw SQL skips the stock signals: refresh totals now, size/color facets after commit
+        Products.objects.filter(pk__in=touched).refresh_stock_totals()
+        mark_products_dirty(touched, ('facets',))
+    return results
@@ -0,0 +1,39 @@
+"""Shared test fixtures for the catalog and everything built on it"""
+from django.test import TestCase
+
+from .models import CategoriesModel, SubCategoriesModel, Products, ProductStockModel
+
+
+class CatalogTestCase(TestCase):
+    """One category (Shoes) with one subcategory (Sneakers), plus a helper for products"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = CategoriesModel.objects.create(name='Shoes', image='categories/shoes.png')
+        cls.subcategory = SubCategoriesModel.objects.create(
+            categories=category, name='Sneakers', collectionName='Street', image='subCategories/sneakers.png'
+        )
+
+    @classmethod
+    def create_product(cls, **fields):
+        defaults = {
+            'productName': 'Runner', 'description': 'Light running shoe', 'price': 1000,
+            'SKU': f'RUN-{Products.objects.count() + 1}', 'subCategories': cls.subcategory,
+            'discount': 0, 'discountPerc': 0,
+        }
+        return Products.objects.create(**{**defaults, **fields})
+
+
+class ProductTestCase(CatalogTestCase):
+    """CatalogTestCase plus `product` (Runner, SKU RUN-1) stocked as `stocks`"""
+    # (size, color, quantity)
+    stocks = ((8, 'black', 5), (9, 'black', 2))
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = cls.create_product(SKU='RUN-1')
+        ProductStockModel.objects.bulk_create([
+            ProductStockModel(product=cls.product, size=size, color=color, quantity=quantity)
+            for size, color, quantity in cls.stocks
+        ])
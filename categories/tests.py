@@ -1,3 +1,238 @@
-from django.test import TestCase
+import io
+import uuid
+import shutil
+import tempfile
 
-# Create your tests here.
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .dashboard import rebuild_dashboard
+from .facets import rebuild_all_facets
+from .images import generate_variants, variants_current
+from .models import CategoriesModel, Products, ProductImage, ProductTag, ProductStockModel, FacetCount
+from .serializers import ProductSerializer
+from .stock import apply_stock_adjustments, UPDATED, INSUFFICIENT, NOT_FOUND, INVALID
+from .testing import CatalogTestCase, ProductTestCase
+from .versioning import bump_catalog_version
+
+
+class ProductSerializerWriteTests(CatalogTestCase):
+    def payload(self, variants=1, **extra):
+        data = {
+            'productName': 'Runner',
+            'description': 'Light running shoe',
+            'price': '2499.00',
+            'SKU': 'RUN-1',
+            'subCategories': str(self.subcategory.pk),
+            'discount': '0',
+            'discountPerc': '0',
+            'tags': [{'tag': f'tag{i}'} for i in range(variants)],
+            'materials': [{'material': f'material{i}'} for i in range(variants)],
+            'keyFeatures': [{'feature': f'feature{i}'} for i in range(variants)],
+            'stocks': [{'size': 6 + i, 'color': 'black', 'quantity': 2} for i in range(variants)],
+        }
+        data.update(extra)
+        return data
+
+    def save(self, serializer):
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            product = serializer.save()
+        return product, len(queries)
+
+    def test_create_writes_each_child_table_once(self):
+        _, few = self.save(ProductSerializer(data=self.payload(variants=1)))
+        Products.objects.all().delete()
+        product, many = self.save(ProductSerializer(data=self.payload(variants=30)))
+
+        self.assertEqual(few, many)
+        # product + 4 child INSERTs, stock total refresh, stock totals reload, and two savepoint pairs
+        self.assertEqual(many, 11)
+        self.assertEqual(product.stocks.count(), 30)
+        self.assertEqual(product.tags.count(), 30)
+        self.assertEqual(product.totalStock, 60)
+        self.assertEqual(product.stockMatrix['35'], {'black': 2})
+
+    def test_replace_update_swaps_collections(self):
+        product, _ = self.save(ProductSerializer(data=self.payload(variants=3)))
+        old_stock_ids = set(product.stocks.values_list('id', flat=True))
+
+        serializer = ProductSerializer(product, data={
+            'stocks': [{'size': 10, 'color': 'white', 'quantity': 5}],
+            'tags': [],
+        }, partial=True)
+        product, _ = self.save(serializer)
+
+        self.assertEqual(list(product.stocks.values_list('size', 'color', 'quantity')), [(10, 'white', 5)])
+        self.assertFalse(product.stocks.filter(id__in=old_stock_ids).exists())
+        self.assertEqual(product.tags.count(), 0)
+        self.assertEqual(product.materials.count(), 3)
+        self.assertEqual(product.totalStock, 5)
+        self.assertEqual(product.stockMatrix, {'10': {'white': 5}})
+
+    def test_diff_update_only_writes_changes(self):
+        product, _ = self.save(ProductSerializer(data=self.payload(variants=3)))
+        kept = product.stocks.get(size=6)
+        changed = product.stocks.get(size=7)
+
+        serializer = ProductSerializer(product, data={
+            'stocks': [
+                {'size': 6, 'color': 'black', 'quantity': 2},
+                {'size': 7, 'color': 'black', 'quantity': 9},
+                {'size': 11, 'color': 'red', 'quantity': 1},
+            ],
+        }, partial=True, context={'children_mode': 'diff'})
+        product, _ = self.save(serializer)
+
+        stocks = {(stock.size, stock.color): stock for stock in product.stocks.all()}
+        self.assertEqual(set(stocks), {(6, 'black'), (7, 'black'), (11, 'red')})
+        self.assertEqual(stocks[(6, 'black')].id, kept.id)
+        self.assertEqual(stocks[(7, 'black')].id, changed.id)
+        self.assertEqual(stocks[(7, 'black')].quantity, 9)
+        self.assertEqual(product.totalStock, 12)
+
+    def test_diff_update_drops_duplicate_rows(self):
+        product, _ = self.save(ProductSerializer(data=self.payload(variants=2)))
+        kept = product.tags.get(tag='tag0')
+        ProductTag.objects.create(product=product, tag='tag0')
+
+        serializer = ProductSerializer(product, data={
+            'tags': [{'tag': 'tag0'}, {'tag': 'tag1'}],
+        }, partial=True, context={'children_mode': 'diff'})
+        product, _ = self.save(serializer)
+
+        self.assertEqual(sorted(product.tags.values_list('tag', flat=True)), ['tag0', 'tag1'])
+        self.assertEqual(product.tags.get(tag='tag0').id, kept.id)
+
+
+class StockAdjustmentTests(ProductTestCase):
+    def quantity(self, size):
+        return ProductStockModel.objects.get(product=self.product, size=size, color='black').quantity
+
+    def test_outcome_per_item(self):
+        results = apply_stock_adjustments([
+            {'productId': str(self.product.pk), 'size': 8, 'color': 'black', 'delta': -2},
+            {'SKU': 'RUN-1', 'size': 9, 'color': 'black', 'quantity': 7},
+            {'SKU': 'RUN-1', 'size': 10, 'color': 'black', 'delta': 1},
+            {'SKU': 'NOPE', 'size': 8, 'color': 'black', 'delta': 1},
+            {'SKU': 'RUN-1', 'size': 'eight', 'color': 'black', 'delta': 1},
+        ])
+
+        self.assertEqual(
+            [(result['index'], result['status'], result['quantity']) for result in results],
+            [(0, UPDATED, 3), (1, UPDATED, 7), (2, NOT_FOUND, None), (3, NOT_FOUND, None), (4, INVALID, None)]
+        )
+        self.assertEqual(results[4]['error'], 'size must be an integer')
+        self.assertEqual((self.quantity(8), self.quantity(9)), (3, 7))
+        self.product.refresh_from_db(fields=['totalStock'])
+        self.assertEqual(self.product.totalStock, 10)
+
+    def test_never_goes_below_zero(self):
+        results = apply_stock_adjustments([
+            {'SKU': 'RUN-1', 'size': 9, 'color': 'black', 'delta': -3},
+            {'SKU': 'RUN-1', 'size': 8, 'color': 'black', 'delta': -5},
+        ])
+
+        self.assertEqual(results[0], {'index': 0, 'status': INSUFFICIENT, 'quantity': 2})
+        self.assertEqual(results[1], {'index': 1, 'status': UPDATED, 'quantity': 0})
+        self.assertEqual((self.quantity(8), self.quantity(9)), (0, 2))
+
+    def test_changes_to_one_variant_fold_in_order(self):
+        results = apply_stock_adjustments([
+            {'SKU': 'RUN-1', 'size': 8, 'color': 'black', 'delta': -4},
+            {'SKU': 'RUN-1', 'size': 8, 'color': 'black', 'quantity': 2},
+            {'SKU': 'RUN-1', 'size': 8, 'color': 'black', 'delta': -3},
+        ])
+
+        # quantity=2 then -3 lands below zero, so the whole fold is skipped
+        self.assertEqual({result['status'] for result in results}, {INSUFFICIENT})
+        self.assertEqual(self.quantity(8), 5)
+
+
+@override_settings(DASHBOARD_ASYNC_REBUILD=False)
+class StockBulkWriteTests(ProductTestCase):
+    def facet_count(self, facet, value):
+        return FacetCount.objects.filter(facet=facet, value=value).values_list('count', flat=True).first() or 0
+
+    def test_bulk_writes_refresh_facets_and_catalog_version(self):
+        rebuild_all_facets()
+        client = APIClient()
+        etag = client.get('/api/categories/products/')['ETag']
+        self.assertEqual((self.facet_count('size', '9'), self.facet_count('size', '10')), (1, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductStockModel.objects.filter(product=self.product, size=9).update(quantity=0)
+            ProductStockModel.objects.bulk_create([
+                ProductStockModel(product=self.product, size=10, color='white', quantity=3)
+            ])
+
+        self.assertEqual((self.facet_count('size', '9'), self.facet_count('size', '10')), (0, 1))
+        self.assertEqual(self.facet_count('color', 'white'), 1)
+        response = client.get('/api/categories/products/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+
+class ConditionalGetTests(ProductTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        bump_catalog_version()
+        rebuild_dashboard()
+
+    def assertValidators(self, response, status_code, present):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response.has_header('ETag'), present)
+        self.assertEqual(response.has_header('Last-Modified'), present)
+
+    def test_only_successful_catalog_reads_carry_validators(self):
+        url = f'/api/categories/products/productId/{self.product.pk}'
+        response = self.client.get(url)
+        self.assertValidators(response, 200, True)
+        self.assertValidators(self.client.get(url, headers={'If-None-Match': response['ETag']}), 304, True)
+        self.assertValidators(self.client.get(f'/api/categories/products/productId/{uuid.uuid4()}'), 404, False)
+
+    def test_only_successful_dashboards_carry_validators(self):
+        self.assertValidators(self.client.get('/api/categories/dashboard'), 200, True)
+        self.assertValidators(self.client.get('/api/categories/dashboard', {'rail': 'nope'}), 400, False)
+        self.assertValidators(self.client.get('/api/categories/dashboard', {'limit': 'x'}), 400, False)
+
+        # An empty catalog still has a snapshot, which must not validate the 404
+        CategoriesModel.objects.all().delete()
+        rebuild_dashboard()
+        self.assertValidators(self.client.get('/api/categories/dashboard'), 404, False)
+
+class ImageVariantTests(ProductTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        storage = override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media_root}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def image(self, name, content):
+        return ProductImage.objects.create(product=self.product, image=default_storage.save(name, ContentFile(content)))
+
+    def test_bad_images_are_skipped(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'PNG')
+        corrupt = self.image('products/images/corrupt.png', b'not a png')
+        missing = ProductImage.objects.create(product=self.product, image='products/images/missing.png')
+        good = self.image('products/images/good.png', buffer.getvalue())
+
+        refs = [(image._meta.label, image.pk) for image in (corrupt, missing, good)]
+        with self.assertLogs('categories.images', 'ERROR') as logs:
+            self.assertEqual(generate_variants(refs), 1)
+
+        self.assertEqual(len(logs.records), 2)
+        for image in (corrupt, missing, good):
+            image.refresh_from_db()
+        self.assertEqual([variants_current(image) for image in (corrupt, missing, good)], [False, False, True])
@@ -1,6 +1,8 @@
 from django.urls import path
 from .views import (category_list_create, subCategory_list_create,getSubCategorieById,
-                    getProducts, getProductById, getProductBySubCategory,getProductBySKU)
+                    getProducts, getProductById, getProductBySubCategory,getProductBySKU,
+                    searchProducts, getProductsBatch, exportCatalog, productCacheStats,
+                    createProduct, updateProduct, bulkAdjustStock)
 from .dashboard import dashboardHome
 
 urlpatterns = [
@@ -8,6 +10,13 @@ urlpatterns = [
     path('subcategory/<uuid:categoryId>', getSubCategorieById, name='subcategory-list-create'),
     path('subcategory/', subCategory_list_create, name='subcategory-list-create'),
     path('products/', getProducts, name='get-products'),
+    path('products/search', searchProducts, name='product-search'),
+    path('products/batch', getProductsBatch, name='product-batch'),
+    path('products/export', exportCatalog, name='product-export'),
+    path('products/cache-stats', productCacheStats, name='product-cache-stats'),
+    path('products/manage', createProduct, name='product-create'),
+    path('products/manage/<uuid:productId>', updateProduct, name='product-update'),
+    path('products/stock/bulk', bulkAdjustStock, name='product-stock-bulk'),
     path('products/<sku>', getProductBySKU, name='product-detail'),
     path('products/productId/<uuid:productId>', getProductById, name='product-detail'),
     path('products/subcategory/<uuid:subCategoryId>', getProductBySubCategory, name='product-by-subcategories'),
@@ -1,18 +1,36 @@
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from drf_spectacular.openapi import OpenApiTypes
 from rest_framework.decorators import (
     api_view, authentication_classes, permission_classes
 )
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.response import Response
 from rest_framework import status
 from yaml import serialize
 
+from rest_framework.exceptions import APIException
+from django.http import StreamingHttpResponse
+
 from .models import CategoriesModel, SubCategoriesModel, Products
-from .serializers import CategorySerializer, SubCategorySerializer, ProductSerializer
+from .serializers import (
+    CategorySerializer, SubCategorySerializer, ProductSerializer, ProductFieldSelection,
+    StockAdjustmentBatchSerializer,
+    ProductBatchLookupSerializer
+)
+from .pagination import ProductKeysetPagination, SearchKeysetPagination
+from .search import search_products
+from .facets import apply_facet_filters, facet_counts
+from .versioning import catalog_conditional, request_catalog_version
+from .cache import product_cache
+from .export import iter_catalog_export, EXPORT_FORMATS
+from .stock import apply_stock_adjustments, OUTCOMES as STOCK_OUTCOMES
 
 
 
 @extend_schema(request=CategorySerializer)
+@catalog_conditional
 @api_view(['POST', 'GET'])
 # @permission_classes([IsAuthenticated])
 @authentication_classes([])           # ← No authentication required
@@ -40,6 +58,7 @@ def category_list_create(request):
 
 
 @extend_schema(request=SubCategorySerializer)
+@catalog_conditional
 @api_view(['POST', 'GET'])
 @authentication_classes([])
 @permission_classes([AllowAny])
@@ -57,6 +76,7 @@ def getSubCategorieById(request, categoryId):
 
 
 @extend_schema(request=SubCategorySerializer)
+@catalog_conditional
 @api_view(['POST', 'GET'])
 @authentication_classes([])           # ← No authentication required
 @permission_classes([AllowAny])
@@ -83,71 +103,268 @@ def subCategory_list_create(request):
 
 
 @extend_schema(request=ProductSerializer)
-@api_view(['POST', 'GET'])
-@authentication_classes([])           # ← No authentication required
-@permission_classes([AllowAny])
-def getProducts(request):
-    if request.method == 'GET':
-        products = Products.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
-    else:
-        return Response({'error': 'Method not allowed', 'success': False}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
-
-
-@extend_schema(request=ProductSerializer)
+@catalog_conditional
 @api_view(['GET'])
 @authentication_classes([])           # ← No authentication required
 @permission_classes([AllowAny])
 def getProducts(request):
     if request.method == 'GET':
-        products = Products.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        selection = ProductFieldSelection.from_request(request)
+        products, filtered = apply_facet_filters(Products.objects.all(), request)
+        paginator = ProductKeysetPagination()
+        page = paginator.paginate_queryset(selection.apply(products), request)
+        serializer = selection.serializer(page, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        # Unfiltered catalog counts are precomputed; filtered ones take one grouped query
+        response.data['facets'] = facet_counts(products if filtered else None)
+        return response
     return Response({'error': 'Method not allowed', 'success': False}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+def cached_product_detail(request, selection, lookup):
+    """
+    Serialized product for ('id', productId) or ('sku', SKU), served from the
+    per-worker product cache while the catalog version is unchanged.
+    Raises Products.DoesNotExist for unknown products.
+    """
+    kind, value = lookup
+    fields = tuple(selection.serializer_fields)
+    version, _ = request_catalog_version(request)
+
+    payload = product_cache.get((kind, str(value), fields), version)
+    if payload is not None:
+        return payload
+
+    key_field = 'productId' if kind == 'id' else 'SKU'
+    product = selection.apply(Products.objects.all(), extra_columns=['SKU']).get(**{key_field: value})
+    payload = dict(selection.serializer(product).data)
+    product_cache.set(
+        [('id', str(product.productId), fields), ('sku', product.SKU, fields)],
+        version, payload
+    )
+    return payload
+
+
 @extend_schema(request=ProductSerializer)
+@catalog_conditional
 @api_view(['GET'])
 @authentication_classes([])           # ← No authentication required
 @permission_classes([AllowAny])
 def getProductBySKU(request, sku):
     if request.method == 'GET':
         try:
-            product = Products.objects.get(SKU=sku)
-            serializer = ProductSerializer(product)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            selection = ProductFieldSelection.from_request(request)
+            return Response(cached_product_detail(request, selection, ('sku', sku)), status=status.HTTP_200_OK)
         except Products.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     return Response({'error': 'Method not allowed', 'success': False}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
 @extend_schema(request=ProductSerializer)
+@catalog_conditional
 @api_view(['GET'])
 @authentication_classes([])           # ← No authentication required
 @permission_classes([AllowAny])
 def getProductById(request, productId):
     if request.method == 'GET':
         try:
-            product = Products.objects.get(productId=productId)
-            serializer = ProductSerializer(product)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            selection = ProductFieldSelection.from_request(request)
+            return Response(cached_product_detail(request, selection, ('id', productId)), status=status.HTTP_200_OK)
         except Products.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     return Response({'error': 'Method not allowed', 'success': False}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+@extend_schema(request=ProductBatchLookupSerializer, parameters=[
+    OpenApiParameter('fields', OpenApiTypes.STR, OpenApiParameter.QUERY),
+    OpenApiParameter('expand', OpenApiTypes.STR, OpenApiParameter.QUERY),
+])
+@api_view(['POST'])
+@authentication_classes([])           # ← No authentication required
+@permission_classes([AllowAny])
+def getProductsBatch(request):
+    """
+    Resolve many products in one call.
+    Body: {"productIds": [...]} or {"skus": [...]} (up to 500).
+    `results` follows the input order with null for every miss; the missed
+    keys are also listed in `missing`. ?fields= / ?expand= apply as usual.
+    """
+    lookup = ProductBatchLookupSerializer(data=request.data)
+    if not lookup.is_valid():
+        return Response({'errors': lookup.errors, 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+
+    if 'productIds' in lookup.validated_data:
+        keys, key_field = lookup.validated_data['productIds'], 'productId'
+    else:
+        keys, key_field = lookup.validated_data['skus'], 'SKU'
+
+    selection = ProductFieldSelection.from_request(request)
+    products = list(selection.apply(
+        Products.objects.filter(**{f'{key_field}__in': set(keys)}),
+        extra_columns=[key_field]
+    ))
+    serialized = {
+        getattr(product, key_field): data
+        for product, data in zip(products, selection.serializer(products, many=True).data)
+    }
+
+    return Response({
+        'success': True,
+        'results': [serialized.get(key) for key in keys],
+        'missing': [str(key) for key in keys if key not in serialized],
+    }, status=status.HTTP_200_OK)
+
+
+@catalog_conditional
 @api_view(['GET'])
 @authentication_classes([])           # ← No authentication required
 @permission_classes([AllowAny])
 def getProductBySubCategory(request, subCategoryId):
     try:
+        selection = ProductFieldSelection.from_request(request)
         products = Products.objects.filter(subCategories=subCategoryId)
         if not products.exists():
             return Response({'error': 'No products found in this subcategory'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        products, _ = apply_facet_filters(products, request)
+        paginator = ProductKeysetPagination()
+        page = paginator.paginate_queryset(selection.apply(products), request)
+        serializer = selection.serializer(page, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['facets'] = facet_counts(products)
+        return response
 
+    except APIException:
+        raise
     except Exception as e:
-        return Response({'error': str(e), 'success': False}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e), 'success': False}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@extend_schema(parameters=[
+    OpenApiParameter('q', OpenApiTypes.STR, OpenApiParameter.QUERY, required=True),
+    OpenApiParameter('fields', OpenApiTypes.STR, OpenApiParameter.QUERY),
+    OpenApiParameter('expand', OpenApiTypes.STR, OpenApiParameter.QUERY),
+    OpenApiParameter('page_size', OpenApiTypes.INT, OpenApiParameter.QUERY),
+    OpenApiParameter('cursor', OpenApiTypes.STR, OpenApiParameter.QUERY),
+])
+@catalog_conditional
+@api_view(['GET'])
+@authentication_classes([])           # ← No authentication required
+@permission_classes([AllowAny])
+def searchProducts(request):
+    """
+    Full-text product search over name, description, tags, materials and features.
+    Results are ranked by text relevance blended with totalSales and accept
+    the same facet filters as the product listings.
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response({'error': 'Query parameter q is required', 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+
+    selection = ProductFieldSelection.from_request(request)
+    products, _ = apply_facet_filters(Products.objects.filter(isActive=True), request)
+    products = search_products(products, text)
+    paginator = SearchKeysetPagination()
+    page = paginator.paginate_queryset(selection.apply(products), request)
+    serializer = selection.serializer(page, many=True)
+    response = paginator.get_paginated_response(serializer.data)
+    response.data['facets'] = facet_counts(products)
+    return response
+
+
+@extend_schema(parameters=[
+    OpenApiParameter('output', OpenApiTypes.STR, OpenApiParameter.QUERY, enum=list(EXPORT_FORMATS)),
+    OpenApiParameter('fields', OpenApiTypes.STR, OpenApiParameter.QUERY),
+    OpenApiParameter('expand', OpenApiTypes.STR, OpenApiParameter.QUERY),
+])
+@api_view(['GET'])
+@authentication_classes([])           # ← No authentication required
+@permission_classes([AllowAny])
+def exportCatalog(request):
+    """
+    Stream the whole catalog for feed consumers and indexers.
+    ?output=ndjson (default, one product per line) or ?output=json (one array).
+    """
+    output = request.query_params.get('output', 'ndjson')
+    if output not in EXPORT_FORMATS:
+        return Response({'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}", 'success': False},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    selection = ProductFieldSelection.from_request(request)
+    content_type = 'application/x-ndjson' if output == 'ndjson' else 'application/json'
+    response = StreamingHttpResponse(iter_catalog_export(output, selection), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="catalog.{output}"'
+    return response
+
+
+@extend_schema(request=ProductSerializer, responses=ProductSerializer)
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, JWTAuthentication])
+@permission_classes([IsAdminUser])
+def createProduct(request):
+    """Create a product with its nested images, tags, materials, features and stocks"""
+    serializer = ProductSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors, 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response({'success': True, 'data': serializer.data}, status=status.HTTP_201_CREATED)
+
+
+@extend_schema(
+    request=ProductSerializer,
+    responses=ProductSerializer,
+    parameters=[OpenApiParameter('children', OpenApiTypes.STR, enum=ProductSerializer.CHILDREN_MODES,
+                                 description="replace (default) swaps nested collections in the payload; "
+                                             "diff keeps matching rows and only writes the changes")]
+)
+@api_view(['PUT', 'PATCH'])
+@authentication_classes([SessionAuthentication, JWTAuthentication])
+@permission_classes([IsAdminUser])
+def updateProduct(request, productId):
+    """Update a product; nested collections left out of the payload are untouched"""
+    mode = request.query_params.get('children', 'replace')
+    if mode not in ProductSerializer.CHILDREN_MODES:
+        return Response({'error': f"children must be one of: {', '.join(ProductSerializer.CHILDREN_MODES)}",
+                         'success': False}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        product = Products.objects.get(productId=productId)
+    except Products.DoesNotExist:
+        return Response({'error': 'Product not found', 'success': False}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = ProductSerializer(
+        product, data=request.data, partial=request.method == 'PATCH', context={'children_mode': mode}
+    )
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors, 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response({'success': True, 'data': serializer.data}, status=status.HTTP_200_OK)
+
+
+@extend_schema(request=StockAdjustmentBatchSerializer)
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, JWTAuthentication])
+@permission_classes([IsAdminUser])
+def bulkAdjustStock(request):
+    """
+    Apply many variant stock changes at once, e.g. a warehouse sync.
+    Body: {"adjustments": [{"SKU" | "productId", "size", "color", "delta" | "quantity"}, ...]}
+    Every item gets an outcome (updated, insufficient_stock, not_found or invalid);
+    a bad item never fails the rest of the batch.
+    """
+    serializer = StockAdjustmentBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors, 'success': False}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = apply_stock_adjustments(serializer.validated_data['adjustments'])
+    summary = dict.fromkeys(STOCK_OUTCOMES, 0)
+    for result in results:
+        summary[result['status']] += 1
+    return Response({'success': True, 'summary': summary, 'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, JWTAuthentication])  # Django admin session works too
+@permission_classes([IsAdminUser])
+def productCacheStats(request):
+    """Hit/miss/eviction counters of this worker's product cache"""
+    return Response({'success': True, 'data': product_cache.stats()}, status=status.HTTP_200_OK)
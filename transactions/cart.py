@@ -0,0 +1,176 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q
+
+from categories.models import Products
+from .models import Cart, CartItem
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+MAX_CART_OPERATIONS = 200
+MAX_ITEM_QUANTITY = 999
+
+
+class CartVersionConflict(Exception):
+    """The client's If-Match version is not the cart's current version"""
+
+    def __init__(self, version):
+        super().__init__(version)
+        self.version = version
+
+
+class CartSyncError(Exception):
+    """Raised with [{'index', 'error'}] when any operation of a batch can't be applied"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def expected_version(request):
+    """The cart version a client sent in If-Match ("3", W/"3" or 3), or None to skip the check"""
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return None
+    try:
+        return int(header.removeprefix('W/').strip('"'))
+    except ValueError:
+        # Can never match a version
+        return -1
+
+
+def lock_cart(user, version=None, create=True):
+    """
+    Get (or create) the user's cart, locked until the end of the transaction
+    so item changes and total refreshes apply one request at a time. Raises
+    CartVersionConflict when `version` is given and the cart has moved on.
+    Returns (cart or None, created).
+    """
+    if create:
+        cart, created = Cart.objects.select_for_update().get_or_create(user=user)
+    else:
+        cart, created = Cart.objects.select_for_update().filter(user=user).first(), False
+    current = cart.version if cart else 0
+    if version is not None and version != current:
+        raise CartVersionConflict(current)
+    return cart, created
+
+
+def _fold(operations):
+    """
+    Collapse operations on the same variant, in order, into one change:
+    {(product_id, size, color): (mode, quantity, operation indexes)}, where
+    mode 'add' adds to the quantity already in the cart, 'set' replaces it
+    (0 removes the line) and 'max' raises it to at least the quantity given.
+    'max' is internal (guest cart merges); clients only send CART_OPERATIONS.
+    """
+    changes = OrderedDict()
+    for index, operation in enumerate(operations):
+        key = (operation['product_id'], operation['size'], operation['color'])
+        mode, quantity, indexes = changes.get(key, (None, 0, []))
+        if operation['op'] == 'remove':
+            mode, quantity = 'set', 0
+        elif operation['op'] == 'set':
+            mode, quantity = 'set', operation['quantity']
+        elif operation['op'] == 'max':
+            mode, quantity = 'max', operation['quantity']
+        else:
+            mode, quantity = mode or 'add', quantity + operation['quantity']
+        changes[key] = (mode, quantity, indexes + [index])
+    return changes
+
+
+def plan_cart_changes(operations, current, clamp=False):
+    """
+    Work out what a batch of operations does to a cart holding `current`
+    ({(product_id, size, color): quantity}), checking every touched variant
+    against one product query. Returns ({variant: (new quantity, product)}
+    for the lines that change, 0 meaning removed; [{'index', 'error'}]).
+
+    With clamp=True nothing is rejected: quantities are cut down to the
+    stock available and unavailable products are dropped, never shrinking
+    a line below what the cart already holds.
+    """
+    changes = _fold(operations)
+    products = Products.objects.only('productId', 'price', 'isActive', 'stockMatrix').in_bulk(
+        {product_id for product_id, _, _ in changes}
+    )
+
+    planned, errors = {}, []
+    for key, (mode, quantity, indexes) in changes.items():
+        product_id, size, color = key
+        if mode == 'add':
+            quantity += current.get(key, 0)
+        elif mode == 'max':
+            quantity = max(quantity, current.get(key, 0))
+        product = products.get(product_id)
+        if quantity == 0:
+            if key in current:
+                planned[key] = (0, product)
+            continue
+
+        if product is None:
+            error = "Product does not exist."
+        elif not product.isActive:
+            error = "Product is not available."
+        elif quantity > MAX_ITEM_QUANTITY:
+            error = f"At most {MAX_ITEM_QUANTITY} of a variant can be added to the cart."
+        elif not product.has_stock(quantity, size=size, color=color):
+            available_stock = product.get_variant_stock(size, color)
+            error = f"Only {available_stock} items available in stock for size {size} and color {color}."
+        else:
+            error = None
+
+        if error and clamp:
+            error = None
+            available = product.get_variant_stock(size, color) if product and product.isActive else 0
+            quantity = max(min(quantity, available, MAX_ITEM_QUANTITY), current.get(key, 0))
+        if error:
+            errors.extend({'index': index, 'error': error} for index in indexes)
+        elif quantity and current.get(key) != quantity:
+            planned[key] = (quantity, product)
+    return planned, sorted(errors, key=lambda error: error['index'])
+
+
+@transaction.atomic
+def sync_cart(user, operations, version=None, clamp=False):
+    """
+    Apply a batch of validated cart operations ({'op', 'product_id', 'size',
+    'color', 'quantity'}) to the user's cart, all or nothing (see
+    plan_cart_changes for clamp). Lines are written with one upsert and one
+    delete. Returns (cart, created).
+    """
+    cart, created = lock_cart(user, version)
+    current = {
+        (product_id, size, color): quantity
+        for product_id, size, color, quantity in CartItem.objects.filter(cart=cart).values_list(
+            'product_id', 'size', 'color', 'quantity'
+        )
+    }
+    planned, errors = plan_cart_changes(operations, current, clamp)
+    if errors:
+        raise CartSyncError(errors)
+
+    upserts = [
+        CartItem(
+            cart=cart, product_id=product_id, size=size, color=color,
+            quantity=quantity, price_at_addition=product.price
+        )
+        for (product_id, size, color), (quantity, product) in planned.items() if quantity
+    ]
+    removals = [key for key, (quantity, _) in planned.items() if not quantity]
+    if upserts:
+        # Existing lines keep the price they were first added at
+        CartItem.objects.bulk_create(
+            upserts, update_conflicts=True,
+            unique_fields=['cart', 'product', 'size', 'color'], update_fields=['quantity', 'updatedAt']
+        )
+    if removals:
+        lines = Q()
+        for product_id, size, color in removals:
+            lines |= Q(product_id=product_id, size=size, color=color)
+        # The totals are refreshed once below
+        CartItem.objects.filter(lines, cart=cart).delete_without_signals()
+    if upserts or removals:
+        Cart.objects.filter(pk=cart.pk).refresh_totals()
+    return cart, created
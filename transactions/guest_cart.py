@@ -0,0 +1,144 @@
+"""
+Guest carts kept entirely client-side, in a signed and compressed token.
+
+Anonymous shoppers never cause a database write: every change returns a new
+token, and the token is merged into the user's Cart once they log in.
+"""
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from categories.models import Products
+from .cart import plan_cart_changes, sync_cart, CartSyncError, MAX_ITEM_QUANTITY
+from .models import CartItem, MergedGuestCart, first_image_prefetch
+from .serializers import CartItemSerializer
+
+logger = logging.getLogger(__name__)
+
+GUEST_CART_SALT = 'transactions.guest_cart'
+GUEST_CART_HEADER = 'X-Guest-Cart'
+GUEST_CART_MAX_AGE = getattr(settings, 'GUEST_CART_MAX_AGE', 30 * 24 * 3600)
+# Keeps tokens small enough for a request header
+MAX_GUEST_CART_LINES = 50
+
+
+class InvalidGuestCart(Exception):
+    pass
+
+
+def dump_guest_cart(lines):
+    """Sign {(product_id, size, color): quantity} into a compact URL-safe token"""
+    payload = [[product_id.hex, size, color, quantity] for (product_id, size, color), quantity in lines.items()]
+    return signing.dumps(payload, salt=GUEST_CART_SALT, compress=True)
+
+
+def load_guest_cart(token):
+    """Verify a token and return its lines; raises InvalidGuestCart if tampered, expired or malformed"""
+    try:
+        payload = signing.loads(token, salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE)
+        lines = OrderedDict()
+        for product_id, size, color, quantity in payload:
+            if not (isinstance(size, int) and isinstance(color, str) and isinstance(quantity, int)):
+                raise ValueError(f'Malformed line {product_id}')
+            if not 1 <= quantity <= MAX_ITEM_QUANTITY:
+                raise ValueError(f'Quantity out of range on line {product_id}')
+            lines[(uuid.UUID(hex=product_id), size, color)] = quantity
+    except (signing.BadSignature, TypeError, ValueError) as exc:
+        raise InvalidGuestCart(str(exc))
+    return lines
+
+
+def guest_cart_token(request):
+    """The guest cart token sent in the X-Guest-Cart header or a `guest_cart` body field"""
+    token = request.headers.get(GUEST_CART_HEADER)
+    if not token and isinstance(request.data, dict):
+        token = request.data.get('guest_cart')
+    return token or None
+
+
+def update_guest_cart(lines, operations):
+    """Apply validated cart operations to guest lines, checking stock with one read; nothing is written"""
+    planned, errors = plan_cart_changes(operations, lines)
+    if errors:
+        raise CartSyncError(errors)
+    lines = OrderedDict(lines)
+    for key, (quantity, _) in planned.items():
+        if quantity:
+            lines[key] = quantity
+        else:
+            lines.pop(key, None)
+    if len(lines) > MAX_GUEST_CART_LINES:
+        raise CartSyncError([{'index': None, 'error': f'A guest cart holds at most {MAX_GUEST_CART_LINES} lines.'}])
+    return lines
+
+
+def render_guest_cart(lines, context=None):
+    """Serialize guest lines like a Cart, loading the products and their first images in two queries"""
+    products = Products.objects.prefetch_related(first_image_prefetch()).in_bulk(
+        {product_id for product_id, _, _ in lines}
+    )
+    items = [
+        CartItem(product=products[product_id], size=size, color=color, quantity=quantity)
+        for (product_id, size, color), quantity in lines.items()
+        # Products deleted since the token was issued drop out
+        if product_id in products
+    ]
+    return {
+        'items': CartItemSerializer(items, many=True, context=context or {}).data,
+        'total_items': sum(item.quantity for item in items),
+        'total_amount': sum(item.total_price for item in items),
+        'items_count': len(items),
+    }
+
+
+@transaction.atomic
+def merge_guest_cart(user, token):
+    """
+    Merge a guest cart into the user's Cart in one bulk upsert. Each line is
+    raised to the guest quantity rather than added to, so the same items
+    are never counted twice. Lines are cut down to the stock available rather
+    than rejected, and lines whose product has gone are dropped.
+
+    A token is merged once: its signature is recorded, and replaying it
+    (e.g. a client that kept it after login) merges nothing. Returns the
+    number of guest lines merged.
+    """
+    lines = load_guest_cart(token)
+    # The HMAC that ends a signed token identifies it
+    signature = token.rsplit(':', 1)[-1]
+    # Tokens past GUEST_CART_MAX_AGE fail to load anyway; their records can go
+    MergedGuestCart.objects.filter(mergedAt__lt=timezone.now() - timedelta(seconds=GUEST_CART_MAX_AGE)).delete()
+    _, created = MergedGuestCart.objects.get_or_create(signature=signature, defaults={'user': user})
+    if not created:
+        logger.info("Guest cart already merged, ignoring it for user %s", user.pk)
+        return 0
+
+    if lines:
+        operations = [
+            {'op': 'max', 'product_id': product_id, 'size': size, 'color': color, 'quantity': quantity}
+            for (product_id, size, color), quantity in lines.items()
+        ]
+        sync_cart(user, operations, clamp=True)
+    return len(lines)
+
+
+def merge_guest_cart_from_request(request, user):
+    """
+    Merge the request's guest cart, if any, at login; a bad or already merged
+    token merges nothing. Returns lines merged, or None without a token. Any
+    other value tells the client to discard its token.
+    """
+    token = guest_cart_token(request)
+    if not token:
+        return None
+    try:
+        return merge_guest_cart(user, token)
+    except InvalidGuestCart as exc:
+        logger.info("Ignoring guest cart for user %s: %s", user.pk, exc)
+        return 0
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from transactions.recommendations import update_bought_together, TOP_K
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold orders placed since the last run into the product co-purchase counts and refresh "
+        "the bought-together table. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Discard the counts and recompute them from the full order history")
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Related products kept per product")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        orders, products = update_bought_together(rebuild=options['rebuild'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {orders} new orders, refreshed {products} products in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,26 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.trending import compute_trending_scores, HALF_LIFE
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every product's time-decayed trendingScore from recent order items. "
+        "Meant to run periodically (e.g. hourly from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life', type=float, default=HALF_LIFE.total_seconds() / 86400,
+                            help="Days for a sale's weight to halve")
+
+    def handle(self, *args, **options):
+        if options['half_life'] <= 0:
+            raise CommandError("--half-life must be positive")
+        started = time.monotonic()
+        scored, updated = compute_trending_scores(half_life=timedelta(days=options['half_life']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {scored} order items, updated {updated} products in {time.monotonic() - started:.1f}s"
+        ))
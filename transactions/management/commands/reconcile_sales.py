@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from transactions.sales import reconcile_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute totalSales and the 7/30-day sales windows from the items of paid orders and fix "
+        "products that drifted. Run at least daily (e.g. from cron) so the windows roll forward."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, don't repair it")
+
+    def handle(self, *args, **options):
+        drifted = reconcile_sales(dry_run=options['dry_run'])
+        for pk, sku, stored, actual in drifted:
+            self.stdout.write(
+                f"{sku or pk}: stored total/7d/30d {'/'.join(map(str, stored))}, "
+                f"actual {'/'.join(map(str, actual))}"
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("No sales drift found"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} products drifted (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled sales counters on {len(drifted)} products"))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0009_product_stock_matrix'),
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationJobState',
+            fields=[
+                ('job', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('processedUntil', models.DateTimeField(blank=True, null=True)),
+                ('updatedAt', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'recommendation_job_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='BoughtTogether',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bought_together', to='categories.products')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.products')),
+            ],
+            options={
+                'db_table': 'bought_together',
+                'ordering': ['product', 'rank'],
+                'indexes': [models.Index(fields=['product', 'rank'], name='bought_together_lookup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.products')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.products')),
+            ],
+            options={
+                'db_table': 'product_pair_counts',
+                'unique_together': {('product', 'other')},
+            },
+        ),
+    ]
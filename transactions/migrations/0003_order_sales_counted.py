@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+# Orders paid before payment times were recorded get their last update as the
+# payment time, once, so nothing keyed on paidAt moves when they are saved
+# again. Those still counting as sales are flagged as counted: a later status
+# change must not count them a second time (reconcile_sales folds them into
+# the product counters).
+BACKFILL_PAID_ORDERS = """
+UPDATE orders SET "paidAt" = "updatedAt" WHERE "paymentStatus" = 'PAID' AND "paidAt" IS NULL;
+UPDATE orders SET "salesCounted" = TRUE
+WHERE "paymentStatus" = 'PAID' AND status NOT IN ('CANCELLED', 'RETURNED', 'REFUNDED');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_bought_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paidAt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='salesCounted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_PAID_ORDERS, reverse_sql=migrations.RunSQL.noop),
+    ]
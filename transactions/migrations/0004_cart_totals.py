@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+BACKFILL_CART_TOTALS = """
+UPDATE carts c SET "totalItems" = t.total_items, "itemsCount" = t.items_count, "totalAmount" = t.total_amount
+FROM (
+    SELECT i.cart_id, sum(i.quantity) AS total_items, count(*) AS items_count,
+           sum(i.quantity * coalesce(i.price_at_addition, p.price)) AS total_amount
+    FROM cart_items i JOIN categories_products p ON p."productId" = i.product_id
+    GROUP BY i.cart_id
+) t
+WHERE t.cart_id = c."cartId";
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_order_sales_counted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='itemsCount',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='totalAmount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='totalItems',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_CART_TOTALS, reverse_sql=migrations.RunSQL.noop),
+    ]
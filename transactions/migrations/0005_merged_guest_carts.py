@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_cart_totals'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MergedGuestCart',
+            fields=[
+                ('signature', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('mergedAt', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='merged_guest_carts', to='users.users')),
+            ],
+            options={
+                'db_table': 'merged_guest_carts',
+            },
+        ),
+    ]
@@ -1,18 +1,67 @@
 import uuid
+from decimal import Decimal
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import Users, Addresses
-from categories.models import Products
+from categories.models import Products, ProductImage, ChildRowQuerySet
 
 
 # Create your models here.
 
+def first_image_prefetch(lookup='images'):
+    """Prefetch only each product's first image, as `primaryImages`, in one DISTINCT ON query"""
+    first_images = ProductImage.objects.order_by('product', 'pk').distinct('product')
+    return models.Prefetch(lookup, queryset=first_images, to_attr='primaryImages')
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Load carts with their items, each item's product and the product's
+        first image in three queries in total, whatever the cart size.
+        """
+        items = CartItem.objects.select_related('product').prefetch_related(first_image_prefetch('product__images'))
+        return self.prefetch_related(models.Prefetch('items', queryset=items))
+
+    def refresh_totals(self):
+        """
+        Recompute the stored totals from the cart items and bump the version,
+        in one UPDATE. Callers changing several items refresh once afterwards.
+        """
+        items = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+
+        def total(expression):
+            return models.Subquery(items.annotate(total=expression).values('total'))
+
+        line_amount = models.F('quantity') * Coalesce('price_at_addition', 'product__price')
+        return self.update(
+            totalItems=Coalesce(total(models.Sum('quantity')), 0),
+            itemsCount=Coalesce(total(models.Count('pk')), 0),
+            totalAmount=Coalesce(
+                total(models.Sum(line_amount, output_field=models.DecimalField())), Decimal('0'),
+                output_field=models.DecimalField()
+            ),
+            version=models.F('version') + 1,
+            updatedAt=timezone.now(),
+        )
+
+
 class Cart(models.Model):
     cartId = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(Users, on_delete=models.CASCADE, related_name='cart')
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
     isActive = models.BooleanField(default=True)
+    # Denormalized from the items by CartQuerySet.refresh_totals(), which also bumps the
+    # version clients send back in If-Match
+    totalItems = models.PositiveIntegerField(default=0, editable=False)
+    itemsCount = models.PositiveIntegerField(default=0, editable=False)
+    totalAmount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CartQuerySet.as_manager()
 
     class Meta:
         db_table = 'carts'
@@ -24,15 +73,15 @@ class Cart(models.Model):
 
     @property
     def total_items(self):
-        return self.items.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.totalItems
 
     @property
     def total_amount(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.totalAmount
 
     @property
     def items_count(self):
-        return self.items.count()
+        return self.itemsCount
 
 
 class CartItem(models.Model):
@@ -50,6 +99,8 @@ class CartItem(models.Model):
     addedAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
 
+    objects = ChildRowQuerySet.as_manager()
+
     class Meta:
         unique_together = ('cart', 'product', 'size', 'color')
         db_table = 'cart_items'
@@ -77,6 +128,19 @@ class CartItem(models.Model):
         return self.price_at_addition if self.price_at_addition else self.product.price
 
 
+class MergedGuestCart(models.Model):
+    """Signature of a guest cart token already merged at login, so the same token can't be merged twice"""
+    signature = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='merged_guest_carts')
+    mergedAt = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'merged_guest_carts'
+
+    def __str__(self):
+        return f"Guest cart merged for {self.user.phoneNumber}"
+
+
 class Wishlist(models.Model):
     wishlistId = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='wishlists')
@@ -152,9 +216,13 @@ class Order(models.Model):
     # Payment Gateway Information
     razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
 
+    # Whether the items are currently included in Products.totalSales (transactions.sales)
+    salesCounted = models.BooleanField(default=False, editable=False)
+
     # Timestamps
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
+    paidAt = models.DateTimeField(null=True, blank=True)
     deliveredAt = models.DateTimeField(null=True, blank=True)
 
     # Additional Information
@@ -304,4 +372,48 @@ class OrderStatusHistory(models.Model):
         ordering = ['-createdAt']
 
     def __str__(self):
-        return f"Order {self.order.orderNumber} - {self.status}"
\ No newline at end of file
+        return f"Order {self.order.orderNumber} - {self.status}"
+
+# ============ RECOMMENDATIONS ============
+
+class ProductPairCount(models.Model):
+    """How many orders contained both products; stored in both directions"""
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_pair_counts'
+        unique_together = ('product', 'other')
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.count}"
+
+
+class BoughtTogether(models.Model):
+    """Top-K co-purchased products per product, rebuilt by transactions.recommendations"""
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='bought_together')
+    related = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = 'bought_together'
+        ordering = ['product', 'rank']
+        indexes = [models.Index(fields=['product', 'rank'], name='bought_together_lookup')]
+
+    def __str__(self):
+        return f"{self.product_id} #{self.rank}: {self.related_id}"
+
+
+class RecommendationJobState(models.Model):
+    """Watermark of an incremental batch job: orders paid up to processedUntil are counted"""
+    job = models.CharField(max_length=50, primary_key=True)
+    processedUntil = models.DateTimeField(null=True, blank=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'recommendation_job_state'
+
+    def __str__(self):
+        return f"{self.job} up to {self.processedUntil}"
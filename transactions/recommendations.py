@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Order, OrderItem, ProductPairCount, BoughtTogether, RecommendationJobState
+from .sales import PAID_ORDERS
+
+JOB_NAME = 'bought_together'
+TOP_K = 12
+# Orders paid this recently may still be committing their items; pick them up next run
+SETTLE_DELAY = timedelta(minutes=5)
+# Bulk/B2B baskets carry little signal and cost O(n^2) pairs
+MAX_BASKET_SIZE = 50
+STATEMENT_SIZE = 10000
+
+
+def co_occurrence(order_index, product_index):
+    """
+    Count how many baskets contain each ordered product pair.
+
+    Takes parallel integer arrays with one entry per distinct (order, product)
+    and returns (product_a, product_b, counts) index arrays, pairs in both
+    directions. Pairs are generated per basket with index arithmetic only.
+    """
+    order_index = np.asarray(order_index, dtype=np.int64)
+    product_index = np.asarray(product_index, dtype=np.int64)
+    empty = np.empty(0, dtype=np.int64)
+
+    # Group rows by basket and drop baskets that are too small or too large
+    by_order = np.argsort(order_index, kind='stable')
+    order_index, product_index = order_index[by_order], product_index[by_order]
+    basket_sizes = np.bincount(order_index)
+    row_basket_sizes = basket_sizes[order_index]
+    keep = (row_basket_sizes >= 2) & (row_basket_sizes <= MAX_BASKET_SIZE)
+    order_index, product_index, row_basket_sizes = order_index[keep], product_index[keep], row_basket_sizes[keep]
+    if order_index.size == 0:
+        return empty, empty, empty
+
+    # Row r pairs with every row of its basket: repeat r basket-size times and
+    # walk the basket alongside it
+    basket_starts = np.searchsorted(order_index, order_index)
+    left = np.repeat(np.arange(order_index.size), row_basket_sizes)
+    block_starts = np.repeat(np.cumsum(row_basket_sizes) - row_basket_sizes, row_basket_sizes)
+    right = basket_starts[left] + (np.arange(left.size) - block_starts)
+    distinct = left != right
+
+    width = int(product_index.max()) + 1
+    keys, counts = np.unique(product_index[left[distinct]] * width + product_index[right[distinct]], return_counts=True)
+    return keys // width, keys % width, counts
+
+
+def _add_pair_counts(product_a, product_b, counts):
+    table = ProductPairCount._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(counts), STATEMENT_SIZE):
+            end = start + STATEMENT_SIZE
+            cursor.execute(f'''
+                INSERT INTO {table} (product_id, other_id, count)
+                SELECT * FROM unnest(%s::uuid[], %s::uuid[], %s::integer[])
+                ON CONFLICT (product_id, other_id) DO UPDATE SET count = {table}.count + EXCLUDED.count
+            ''', [
+                [str(value) for value in product_a[start:end]],
+                [str(value) for value in product_b[start:end]],
+                counts[start:end].tolist(),
+            ])
+
+
+def _rebuild_top_k(product_ids, top_k=TOP_K):
+    ranked = ProductPairCount.objects.filter(product__in=product_ids).annotate(
+        pairRank=Window(
+            expression=RowNumber(),
+            partition_by=[F('product')],
+            order_by=[F('count').desc(), F('other').asc()]
+        )
+    ).filter(pairRank__lte=top_k).values_list('product_id', 'other_id', 'count', 'pairRank')
+
+    BoughtTogether.objects.filter(product__in=product_ids).delete()
+    BoughtTogether.objects.bulk_create([
+        BoughtTogether(product_id=product_id, related_id=other_id, count=count, rank=rank)
+        for product_id, other_id, count, rank in ranked
+    ], batch_size=STATEMENT_SIZE)
+
+
+@transaction.atomic
+def update_bought_together(rebuild=False, top_k=TOP_K):
+    """
+    Fold orders paid since the last run into the pair counts and refresh
+    the top-K table of every product they touched. Only sales count (see
+    sales.PAID_ORDERS); an order reversed after it was counted stays in the
+    counts until the next rebuild=True, which recomputes them from the full
+    order history. Returns (orders processed, products refreshed).
+    """
+    state, _ = RecommendationJobState.objects.select_for_update().get_or_create(job=JOB_NAME)
+    if rebuild:
+        ProductPairCount.objects.all().delete()
+        BoughtTogether.objects.all().delete()
+        state.processedUntil = None
+
+    cutoff = timezone.now() - SETTLE_DELAY
+    # Keyed on payment time, so an order paid long after it was placed is still
+    # picked up; paidAt never changes once set, unlike updatedAt
+    orders = Order.objects.filter(PAID_ORDERS, paidAt__lte=cutoff)
+    if state.processedUntil is not None:
+        orders = orders.filter(paidAt__gt=state.processedUntil)
+
+    rows = list(
+        OrderItem.objects.filter(order__in=orders.values('pk'))
+        .values_list('order_id', 'product_id').distinct()
+    )
+    order_count = len({order_id for order_id, _ in rows})
+
+    refreshed = 0
+    if rows:
+        # Dense integer ids for NumPy; the arrays are mapped back to UUIDs afterwards
+        order_ids, products = {}, {}
+        order_index = [order_ids.setdefault(order_id, len(order_ids)) for order_id, _ in rows]
+        product_index = [products.setdefault(product_id, len(products)) for _, product_id in rows]
+        product_a, product_b, counts = co_occurrence(order_index, product_index)
+        if counts.size:
+            by_index = np.array(list(products), dtype=object)
+            product_a, product_b = by_index[product_a], by_index[product_b]
+            _add_pair_counts(product_a, product_b, counts)
+            touched = set(product_a.tolist())
+            _rebuild_top_k(touched, top_k)
+            refreshed = len(touched)
+
+    state.processedUntil = cutoff
+    state.save()
+    return order_count, refreshed
@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from categories.models import Products
+from categories.signals import mark_sales_changed
+
+from .models import Order, OrderItem
+
+# Orders in these states don't count as sales, even if they were paid once
+REVERSED_STATUSES = ('CANCELLED', 'RETURNED', 'REFUNDED')
+# The same rule as counts_as_sale, for querysets
+PAID_ORDERS = Q(paymentStatus='PAID') & ~Q(status__in=REVERSED_STATUSES)
+SALES_WINDOWS = {
+    'sales7d': timedelta(days=7),
+    'sales30d': timedelta(days=30),
+}
+
+
+def counts_as_sale(order):
+    return order.paymentStatus == 'PAID' and order.status not in REVERSED_STATUSES
+
+
+def _order_quantities(order_id):
+    return dict(
+        OrderItem.objects.filter(order_id=order_id)
+        .values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units')
+    )
+
+
+def _apply(quantities, sign, windows):
+    """One UPDATE adding sign * quantity to the counters of every product in the order"""
+    def delta(field):
+        change = Case(
+            *[When(pk=product_id, then=Value(sign * units)) for product_id, units in quantities.items()],
+            default=Value(0), output_field=IntegerField()
+        )
+        return Greatest(F(field) + change, Value(0))
+
+    Products.objects.filter(pk__in=quantities).update(**{field: delta(field) for field in ('totalSales', *windows)})
+    mark_sales_changed()
+
+
+@transaction.atomic
+def record_order_sales(order):
+    """
+    Add a paid order's items to the product sales counters. Safe to call
+    repeatedly and concurrently: only the call that flips Order.salesCounted
+    applies the increments.
+    """
+    now = timezone.now()
+    claimed = Order.objects.filter(pk=order.pk, salesCounted=False).update(
+        salesCounted=True, paidAt=Coalesce(F('paidAt'), Value(now))
+    )
+    if not claimed:
+        return False
+    order.salesCounted = True
+    order.paidAt = order.paidAt or now
+    quantities = _order_quantities(order.pk)
+    if quantities:
+        _apply(quantities, 1, [field for field, window in SALES_WINDOWS.items() if order.paidAt > now - window])
+    return True
+
+
+@transaction.atomic
+def reverse_order_sales(order):
+    """Take a cancelled/refunded order back out of the counters if it was counted"""
+    released = Order.objects.filter(pk=order.pk, salesCounted=True).update(salesCounted=False)
+    if not released:
+        return False
+    order.salesCounted = False
+    paid_at = Order.objects.values_list('paidAt', flat=True).get(pk=order.pk)
+    quantities = _order_quantities(order.pk)
+    if quantities:
+        # A sale older than a window has already dropped out of it
+        now = timezone.now()
+        windows = [field for field, window in SALES_WINDOWS.items() if paid_at and paid_at > now - window]
+        _apply(quantities, -1, windows)
+    return True
+
+
+def sync_order_sales(order):
+    """Count or uncount an order after a payment/status change, whichever its state calls for"""
+    if counts_as_sale(order):
+        return record_order_sales(order)
+    return reverse_order_sales(order)
+
+
+def _units_sold(since=None):
+    items = OrderItem.objects.filter(product=OuterRef('pk'), order__in=Order.objects.filter(PAID_ORDERS))
+    if since is not None:
+        items = items.filter(order__paidAt__gt=since)
+    units = items.order_by().values('product').annotate(units=Sum('quantity')).values('units')
+    return Coalesce(Subquery(units, output_field=IntegerField()), Value(0))
+
+
+@transaction.atomic
+def reconcile_sales(dry_run=False):
+    """
+    Recompute every product's counters from the items of paid orders and fix
+    the ones that drifted, re-flagging orders settled outside the API. The
+    7/30-day windows only shrink here, so run this at least daily.
+    Returns [(pk, SKU, stored, actual)] for the drifted products, counters as
+    (totalSales, sales7d, sales30d) tuples.
+    """
+    if not dry_run:
+        # Stamped once; from then on paidAt stays put when the order is saved again
+        Order.objects.filter(PAID_ORDERS, salesCounted=False).update(
+            salesCounted=True, paidAt=Coalesce(F('paidAt'), F('updatedAt'))
+        )
+        Order.objects.filter(~PAID_ORDERS, salesCounted=True).update(salesCounted=False)
+
+    now = timezone.now()
+    actual = {'actualTotal': _units_sold()}
+    actual.update({f'actual_{field}': _units_sold(now - window) for field, window in SALES_WINDOWS.items()})
+    drift = ~Q(totalSales=F('actualTotal'))
+    for field in SALES_WINDOWS:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+
+    drifted = [
+        (pk, sku, tuple(row[:3]), tuple(row[3:]))
+        for pk, sku, *row in Products.objects.annotate(**actual).filter(drift).values_list(
+            'pk', 'SKU', 'totalSales', *SALES_WINDOWS, 'actualTotal', *[f'actual_{field}' for field in SALES_WINDOWS]
+        )
+    ]
+    if drifted and not dry_run:
+        Products.objects.filter(pk__in=[pk for pk, *_ in drifted]).update(
+            totalSales=_units_sold(), **{field: _units_sold(now - window) for field, window in SALES_WINDOWS.items()}
+        )
+        mark_sales_changed()
+    return drifted
@@ -1,11 +1,14 @@
 from rest_framework import serializers
 from django.db import transaction
 from categories.models import Products
+from categories.media import media_url
 from users.models import Users, Addresses
+from webservices.identity_map import load
 from .models import (
     Wishlist, Cart, CartItem, Order, OrderItem,
     Transaction, OrderStatusHistory
 )
+from .cart import CART_OPERATIONS, MAX_CART_OPERATIONS, MAX_ITEM_QUANTITY
 
 
 # ============ WISHLIST SERIALIZERS ============
@@ -38,7 +41,7 @@ class WishlistSerializer(serializers.ModelSerializer):
 
     def validate_product_id(self, value):
         try:
-            Products.objects.get(pk=value)
+            load(Products, pk=value)
             return value
         except Products.DoesNotExist:
             raise serializers.ValidationError("Product does not exist.")
@@ -46,7 +49,7 @@ class WishlistSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         product_id = validated_data.pop('product_id')
-        product = Products.objects.get(pk=product_id)
+        product = load(Products, pk=product_id)
         size = validated_data.get('size')
         color = validated_data.get('color')
 
@@ -76,13 +79,17 @@ class CartItemProductSerializer(serializers.ModelSerializer):
         return obj.price
 
     def get_image(self, obj):
-        # Get first image from related ProductImage
-        first_image = obj.images.first()
+        # Get first image from related ProductImage, prefetched by Cart.objects.with_items()
+        if hasattr(obj, 'primaryImages'):
+            first_image = obj.primaryImages[0] if obj.primaryImages else None
+        else:
+            first_image = obj.images.first()
         if first_image and first_image.image:
+            url = media_url(first_image.image)
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(first_image.image.url)
-            return first_image.image.url
+                return request.build_absolute_uri(url)
+            return url
         return None
 
 
@@ -115,9 +122,9 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = [
             'cartId', 'user', 'items', 'total_items',
-            'total_amount', 'items_count', 'createdAt', 'updatedAt'
+            'total_amount', 'items_count', 'version', 'createdAt', 'updatedAt'
         ]
-        read_only_fields = ['cartId', 'user', 'createdAt', 'updatedAt']
+        read_only_fields = ['cartId', 'user', 'version', 'createdAt', 'updatedAt']
 
     def get_total_items(self, obj):
         return obj.total_items
@@ -138,14 +145,14 @@ class AddToCartSerializer(serializers.Serializer):
 
     def validate_user_id(self, value):
         try:
-            Users.objects.get(pk=value)
+            load(Users, pk=value)
             return value
         except Users.DoesNotExist:
             raise serializers.ValidationError("User does not exist.")
 
     def validate_product_id(self, value):
         try:
-            product = Products.objects.get(pk=value)
+            product = load(Products, pk=value)
             if not product.isActive:
                 raise serializers.ValidationError("Product is not available.")
             return value
@@ -153,7 +160,7 @@ class AddToCartSerializer(serializers.Serializer):
             raise serializers.ValidationError("Product does not exist.")
 
     def validate(self, attrs):
-        product = Products.objects.get(pk=attrs['product_id'])
+        product = load(Products, pk=attrs['product_id'])
         size = attrs.get('size')
         color = attrs.get('color')
         quantity = attrs['quantity']
@@ -183,6 +190,31 @@ class UpdateCartItemSerializer(serializers.Serializer):
         return value
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """One line change: add to, set or remove a (product, size, color) variant"""
+    op = serializers.ChoiceField(choices=CART_OPERATIONS, default='add')
+    product_id = serializers.UUIDField()
+    size = serializers.IntegerField()
+    color = serializers.CharField(max_length=50)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_ITEM_QUANTITY, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': f"quantity is required for {attrs['op']}."})
+        attrs.setdefault('quantity', 0)
+        return attrs
+
+
+class CartSyncSerializer(serializers.Serializer):
+    operations = serializers.ListField(
+        child=CartOperationSerializer(), allow_empty=False, max_length=MAX_CART_OPERATIONS
+    )
+
+
+class GuestCartSerializer(CartSyncSerializer):
+    guest_cart = serializers.CharField(required=False, allow_blank=True)
+
+
 # ============ ORDER SERIALIZERS ============
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -237,14 +269,14 @@ class CreateOrderSerializer(serializers.Serializer):
 
     def validate_user_id(self, value):
         try:
-            Users.objects.get(pk=value)
+            load(Users, pk=value)
             return value
         except Users.DoesNotExist:
             raise serializers.ValidationError("User does not exist.")
 
     def validate_shipping_address_id(self, value):
         try:
-            Addresses.objects.get(pk=value)
+            load(Addresses, pk=value)
             return value
         except Addresses.DoesNotExist:
             raise serializers.ValidationError("Shipping address does not exist.")
@@ -252,18 +284,18 @@ class CreateOrderSerializer(serializers.Serializer):
     def validate_billing_address_id(self, value):
         if value:
             try:
-                Addresses.objects.get(pk=value)
+                load(Addresses, pk=value)
                 return value
             except Addresses.DoesNotExist:
                 raise serializers.ValidationError("Billing address does not exist.")
         return value
 
     def validate(self, attrs):
-        user = Users.objects.get(pk=attrs['user_id'])
+        user = load(Users, pk=attrs['user_id'])
 
         # Check if user has items in cart
         try:
-            cart = Cart.objects.get(user=user)
+            cart = load(Cart, user=user)
             if not cart.items.exists():
                 raise serializers.ValidationError("Cart is empty.")
         except Cart.DoesNotExist:
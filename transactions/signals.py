@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+
+from .models import Cart, CartItem
+
+
+def cart_item_changed(sender, instance, **kwargs):
+    """Keep the stored cart totals exact inside the same transaction as a single item write"""
+    Cart.objects.filter(pk=instance.cart_id).refresh_totals()
+
+
+post_save.connect(cart_item_changed, sender=CartItem, dispatch_uid='cart_item_changed_save')
+post_delete.connect(cart_item_changed, sender=CartItem, dispatch_uid='cart_item_changed_delete')
@@ -1,3 +1,351 @@
-from django.test import TestCase
+import uuid
+from collections import Counter
+from itertools import permutations
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from categories.dashboard import rebuild_dashboard, SALES_REFRESH
+from categories.models import ProductImage, Products, DashboardSnapshot
+from categories.testing import CatalogTestCase, ProductTestCase
+from categories.versioning import current_catalog_version, SALES_SCOPE
+from users.models import Users, Addresses
+from users.views import guest_cart_fields
+from .cart import sync_cart, lock_cart, CartSyncError, CartVersionConflict
+from .guest_cart import dump_guest_cart, load_guest_cart, merge_guest_cart, InvalidGuestCart, GUEST_CART_MAX_AGE
+from .models import Cart, CartItem, Order, OrderItem
+from .recommendations import co_occurrence, MAX_BASKET_SIZE
+from .sales import record_order_sales
+from .serializers import CartSerializer
+from .trending import compute_trending_scores
+
+
+class CartTestCase(ProductTestCase):
+    """ProductTestCase plus a shopper, `user`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = Users.objects.create(phoneNumber='5550100')
+
+    def lines(self):
+        """The user's cart as {size: quantity}"""
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('size', 'quantity'))
+
+
+class CartReadTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cart = Cart.objects.create(user=Users.objects.create(phoneNumber='5550100'))
+
+    def add_items(self, count):
+        # Two images per product; the cart shows the first one
+        for i in range(count):
+            product = self.create_product(productName=f'Runner {i}', price=1000 + i)
+            ProductImage.objects.create(product=product, image=f'products/runner{i}-a.png')
+            ProductImage.objects.create(product=product, image=f'products/runner{i}-b.png')
+            CartItem.objects.create(cart=self.cart, product=product, size=8, color='black', quantity=2)
+
+    def read_cart(self):
+        return CartSerializer(Cart.objects.with_items().get(pk=self.cart.pk)).data
+
+    def test_query_count_does_not_grow_with_items(self):
+        self.add_items(1)
+        # cart, items with their products, first images
+        with self.assertNumQueries(3):
+            self.read_cart()
+        self.add_items(10)
+        with self.assertNumQueries(3):
+            data = self.read_cart()
+
+        self.assertEqual(data['items_count'], 11)
+        self.assertEqual(data['total_items'], 22)
+        self.assertEqual(data['total_amount'], sum(2 * (1000 + i) for i in (0, *range(10))))
+        for item in data['items']:
+            self.assertIn('-a.png', item['product']['image'])
+
+    def test_totals_match_unprefetched_cart(self):
+        self.add_items(3)
+        data = self.read_cart()
+        cart = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual(
+            (data['items_count'], data['total_items'], data['total_amount']),
+            (cart.items_count, cart.total_items, cart.total_amount)
+        )
+
+
+class CoOccurrenceTests(SimpleTestCase):
+    def reference(self, order_index, product_index):
+        baskets = {}
+        for order, product in zip(order_index, product_index):
+            baskets.setdefault(order, []).append(product)
+        counts = Counter()
+        for products in baskets.values():
+            if 2 <= len(products) <= MAX_BASKET_SIZE:
+                counts.update(permutations(products, 2))
+        return counts
+
+    def test_matches_itertools_reference(self):
+        rng = np.random.default_rng(7)
+        order_index, product_index = [], []
+        # Includes single-item and oversized baskets, which are skipped
+        for order, size in enumerate([1, 2, 3, 5, MAX_BASKET_SIZE, MAX_BASKET_SIZE + 1, *rng.integers(1, 12, 200)]):
+            for product in rng.choice(80, size=size, replace=False):
+                order_index.append(order)
+                product_index.append(int(product))
+        # Rows don't have to arrive grouped by order
+        shuffle = rng.permutation(len(order_index))
+        order_index = [order_index[i] for i in shuffle]
+        product_index = [product_index[i] for i in shuffle]
+
+        product_a, product_b, counts = co_occurrence(order_index, product_index)
+
+        self.assertEqual(
+            dict(zip(zip(product_a.tolist(), product_b.tolist()), counts.tolist())),
+            dict(self.reference(order_index, product_index))
+        )
+
+    def test_no_pairs(self):
+        for rows in (([], []), ([0, 1], [4, 4])):
+            product_a, product_b, counts = co_occurrence(*rows)
+            self.assertEqual((product_a.size, product_b.size, counts.size), (0, 0, 0))
+
+
+class CartSyncTests(CartTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+
+    def operation(self, op='add', size=8, quantity=1):
+        return {'op': op, 'product_id': self.product.pk, 'size': size, 'color': 'black', 'quantity': quantity}
+
+    def sync(self, operations, **headers):
+        return self.client.post(
+            f'/api/transactions/cart/{self.user.pk}/sync/', {'operations': operations}, format='json', headers=headers
+        )
+
+    def test_operations_on_one_variant_fold_in_order(self):
+        response = self.sync([self.operation(quantity=2), self.operation(quantity=1), self.operation(size=9)])
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.lines(), {8: 3, 9: 1})
+        self.assertEqual(response.data['data']['total_items'], 4)
+
+        response = self.sync([self.operation('set', quantity=1), self.operation('remove', size=9)])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.lines(), {8: 1})
+
+    def test_mixed_batch_is_rejected_whole(self):
+        sync_cart(self.user, [self.operation(quantity=1)])
+        operations = [
+            self.operation(quantity=2),
+            self.operation(size=9, quantity=3),
+            self.operation('set', size=10),
+            {**self.operation(), 'product_id': uuid.uuid4()},
+        ]
+
+        with self.assertRaises(CartSyncError) as raised:
+            sync_cart(self.user, operations)
+        self.assertEqual([error['index'] for error in raised.exception.errors], [1, 2, 3])
+
+        response = self.sync(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        # The valid first operation was not applied either
+        self.assertEqual(self.lines(), {8: 1})
+
+    def test_each_change_bumps_the_version(self):
+        response = self.sync([self.operation()])
+        self.assertEqual(response['ETag'], '"1"')
+        response = self.sync([self.operation(size=9)])
+        self.assertEqual(response['ETag'], '"2"')
+
+        # Nothing changes, so the version stays
+        response = self.sync([self.operation('set', quantity=1)])
+        self.assertEqual(response['ETag'], '"2"')
+
+        item = CartItem.objects.get(cart__user=self.user, size=9)
+        item.quantity = 2
+        item.save()
+        self.assertEqual(Cart.objects.get(user=self.user).version, 3)
+        self.assertEqual(self.client.get(f'/api/transactions/cart/{self.user.pk}/')['ETag'], '"3"')
+
+    def test_stale_if_match_is_a_conflict(self):
+        sync_cart(self.user, [self.operation()])
+        sync_cart(self.user, [self.operation()])
+
+        response = self.sync([self.operation()], if_match='"1"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.data['version'], response['ETag']), (2, '"2"'))
+        self.assertEqual(self.lines(), {8: 2})
+
+        response = self.sync([self.operation()], if_match='"2"')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response['ETag'], '"3"')
+        self.assertEqual(self.lines(), {8: 3})
+
+        with self.assertRaises(CartVersionConflict) as raised, transaction.atomic():
+            lock_cart(self.user, version=2)
+        self.assertEqual(raised.exception.version, 3)
+
+
+
+class CreateOrderTests(CartTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        self.address = Addresses.objects.create(user=self.user)
+        sync_cart(self.user, [
+            {'op': 'add', 'product_id': self.product.pk, 'size': 8, 'color': 'black', 'quantity': 2},
+            {'op': 'add', 'product_id': self.product.pk, 'size': 9, 'color': 'black', 'quantity': 1},
+        ])
+
+    def create_order(self, **headers):
+        return self.client.post(
+            '/api/transactions/orders/create/',
+            {'user_id': self.user.pk, 'shipping_address_id': self.address.pk}, format='json', headers=headers
+        )
+
+    def test_stale_if_match_leaves_the_cart_alone(self):
+        sync_cart(self.user, [{'op': 'set', 'product_id': self.product.pk, 'size': 9, 'color': 'black', 'quantity': 2}])
+
+        response = self.create_order(if_match='"1"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.lines(), {8: 2, 9: 2})
+
+class GuestCartMergeTests(CartTestCase):
+    def token(self, **quantities):
+        return dump_guest_cart({(self.product.pk, int(size[1:]), 'black'): quantity for size, quantity in quantities.items()})
+
+    def test_merge_raises_lines_to_the_guest_quantity(self):
+        sync_cart(self.user, [{'op': 'add', 'product_id': self.product.pk, 'size': 8, 'color': 'black', 'quantity': 3}])
+
+        # s9 is cut down to the 2 in stock; s8 already holds more than the guest cart
+        self.assertEqual(merge_guest_cart(self.user, self.token(s8=1, s9=4)), 2)
+        self.assertEqual(self.lines(), {8: 3, 9: 2})
+
+        self.assertEqual(merge_guest_cart(self.user, self.token(s8=4)), 1)
+        self.assertEqual(self.lines(), {8: 4, 9: 2})
+
+    def test_token_is_merged_once(self):
+        token = self.token(s8=2)
+        self.assertEqual(merge_guest_cart(self.user, token), 1)
+        version = Cart.objects.get(user=self.user).version
+        CartItem.objects.filter(cart__user=self.user).delete()
+
+        self.assertEqual(merge_guest_cart(self.user, token), 0)
+        self.assertEqual(self.lines(), {})
+        self.assertEqual(Cart.objects.get(user=self.user).version, version + 1)
+
+    def test_tampered_or_expired_token_is_rejected(self):
+        token = self.token(s8=2)
+        payload, rest = token.split(':', 1)
+        for bad in (payload[:-1] + ('A' if payload[-1] != 'A' else 'B') + ':' + rest, token + 'x', 'garbage'):
+            with self.assertRaises(InvalidGuestCart):
+                load_guest_cart(bad)
+
+        with mock.patch('django.core.signing.time.time', return_value=1e9):
+            expired = self.token(s8=2)
+        with mock.patch('django.core.signing.time.time', return_value=1e9 + GUEST_CART_MAX_AGE + 1):
+            with self.assertRaises(InvalidGuestCart):
+                merge_guest_cart(self.user, expired)
+        self.assertEqual(self.lines(), {})
+
+    def test_login_tells_the_client_to_discard_its_token(self):
+        def login_fields(**headers):
+            request = Request(APIRequestFactory().post('/', {}, format='json', headers=headers), parsers=[JSONParser()])
+            return guest_cart_fields(request, self.user)
+
+        self.assertEqual(login_fields(), {'guest_cart_merged': None, 'discard_guest_cart': False})
+        self.assertEqual(
+            login_fields(**{'X-Guest-Cart': self.token(s8=2)}), {'guest_cart_merged': 1, 'discard_guest_cart': True}
+        )
+        self.assertEqual(login_fields(**{'X-Guest-Cart': 'garbage'}), {'guest_cart_merged': 0, 'discard_guest_cart': True})
+        self.assertEqual(self.lines(), {8: 2})
+
+
+class OrderTestCase(CartTestCase):
+    """CartTestCase plus a paid `order` for two units of `product`"""
+
+    def setUp(self):
+        address = Addresses.objects.create(user=self.user)
+        self.order = Order.objects.create(
+            user=self.user, shippingAddress=address, status='CONFIRMED', paymentStatus='PAID'
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2, unitPrice=1000, totalPrice=2000
+        )
+
+    def record_sale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_order_sales(self.order)
+
+
+@override_settings(DASHBOARD_ASYNC_REBUILD=False)
+class SalesCounterTests(OrderTestCase):
+    def test_sale_bumps_sales_version_not_catalog_version(self):
+        catalog_version, _ = current_catalog_version()
+        sales_version, _ = current_catalog_version(SALES_SCOPE)
+        self.record_sale()
+        self.assertEqual(Products.objects.get(pk=self.product.pk).totalSales, 2)
+        self.assertEqual(current_catalog_version()[0], catalog_version)
+        self.assertEqual(current_catalog_version(SALES_SCOPE)[0], sales_version + 1)
+
+    def test_dashboard_picks_up_sales_after_refresh_interval(self):
+        rebuild_dashboard()
+        self.record_sale()
+        client = APIClient()
+
+        client.get('/api/categories/dashboard')
+        snapshot = DashboardSnapshot.objects.get()
+        self.assertNotEqual(snapshot.payload['salesVersion'], current_catalog_version(SALES_SCOPE)[0])
+
+        DashboardSnapshot.objects.update(builtAt=snapshot.builtAt - SALES_REFRESH)
+        client.get('/api/categories/dashboard')
+        snapshot = DashboardSnapshot.objects.get()
+        self.assertEqual(snapshot.payload['salesVersion'], current_catalog_version(SALES_SCOPE)[0])
+        [product] = snapshot.payload['data'][0]['subcategories'][0]['products']
+        self.assertEqual(product['totalSales'], 2)
+
+
+class TrendingScoreTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.record_sale()
+        self.now = timezone.now()
+        rebuild_dashboard('bestsellers')
+        rebuild_dashboard('trending')
+
+    def built_at(self, rail):
+        return DashboardSnapshot.objects.get(key=f'{rail}:3').builtAt
+
+    def test_changed_scores_rebuild_only_the_trending_rail(self):
+        catalog_version, _ = current_catalog_version()
+        bestsellers_built = self.built_at('bestsellers')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(compute_trending_scores(now=self.now), (1, 1))
+
+        self.assertEqual(current_catalog_version()[0], catalog_version)
+        self.assertEqual(self.built_at('bestsellers'), bestsellers_built)
+        snapshot = DashboardSnapshot.objects.get(key='trending:3')
+        [product] = snapshot.payload['data'][0]['subcategories'][0]['products']
+        self.assertGreater(product['trendingScore'], 0)
+
+    def test_unchanged_scores_rebuild_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            compute_trending_scores(now=self.now)
+        trending_built = self.built_at('trending')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(compute_trending_scores(now=self.now), (1, 0))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.built_at('trending'), trending_built)
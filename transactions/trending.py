@@ -0,0 +1,75 @@
+import math
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from categories.dashboard import rebuild_all_dashboards
+from categories.models import Products
+
+from .models import Order, OrderItem
+from .sales import PAID_ORDERS
+
+HALF_LIFE = timedelta(days=getattr(settings, 'TRENDING_HALF_LIFE_DAYS', 7))
+# Sales older than this many half-lives weigh under 1/4096 and are skipped
+HORIZON_HALF_LIVES = 12
+READ_BATCH_SIZE = 50000
+WRITE_BATCH_SIZE = 1000
+
+
+def decayed_weights(quantities, ages, half_life):
+    """quantity * 2^(-age / half_life) for parallel arrays of quantities and ages in seconds"""
+    return np.asarray(quantities, dtype=np.float64) * np.exp2(-np.asarray(ages, dtype=np.float64) / half_life)
+
+
+def _accumulate(scores, index, rows, now, half_life):
+    positions = np.fromiter((index.get(product_id, -1) for product_id, _, _ in rows), dtype=np.int64, count=len(rows))
+    quantities = np.fromiter((quantity for _, quantity, _ in rows), dtype=np.float64, count=len(rows))
+    ages = now - np.fromiter((created.timestamp() for _, _, created in rows), dtype=np.float64, count=len(rows))
+    # Products created after the score table was read start scoring next run
+    known = positions >= 0
+    weights = decayed_weights(quantities[known], np.maximum(ages[known], 0), half_life)
+    scores += np.bincount(positions[known], weights=weights, minlength=scores.size)
+
+
+def compute_trending_scores(half_life=HALF_LIFE, now=None):
+    """
+    Recompute Products.trendingScore as the sum of units sold in paid orders
+    (sales.PAID_ORDERS), each halved in weight every `half_life` since its
+    order item was created. Order items are
+    streamed and scored in NumPy batches; only changed scores are written,
+    with bulk updates, and only the trending rail's dashboard snapshots are
+    rebuilt for them. Returns (order items scored, products updated).
+    """
+    now = now or timezone.now()
+    current = dict(Products.objects.values_list('pk', 'trendingScore'))
+    index = {pk: position for position, pk in enumerate(current)}
+    scores = np.zeros(len(index), dtype=np.float64)
+
+    rows = (
+        OrderItem.objects.filter(
+            createdAt__gt=now - half_life * HORIZON_HALF_LIVES,
+            order__in=Order.objects.filter(PAID_ORDERS).values('pk')
+        )
+        .values_list('product_id', 'quantity', 'createdAt')
+        .iterator(chunk_size=READ_BATCH_SIZE)
+    )
+    scored = 0
+    while batch := list(islice(rows, READ_BATCH_SIZE)):
+        _accumulate(scores, index, batch, now.timestamp(), half_life.total_seconds())
+        scored += len(batch)
+
+    changed = [
+        Products(pk=pk, trendingScore=float(score))
+        for pk, score in zip(index, scores.tolist())
+        if not math.isclose(score, current[pk], rel_tol=1e-9, abs_tol=1e-9)
+    ]
+    if changed:
+        with transaction.atomic():
+            Products.objects.bulk_update(changed, ['trendingScore'], batch_size=WRITE_BATCH_SIZE)
+            # Scores only order the trending rail; the catalog version stays put
+            transaction.on_commit(lambda: rebuild_all_dashboards(rails=('trending',)))
+    return scored, len(changed)
@@ -13,6 +13,8 @@ urlpatterns = [
     path('cart/add', views.add_to_cart, name='add-to-cart'),
     path('cart/add/', views.add_to_cart, name='add-to-cart-slash'),
     path('cart/<uuid:user_id>/update/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
+    path('cart/<uuid:user_id>/sync/', views.sync_cart_items, name='sync-cart'),
+    path('cart/guest/', views.guest_cart, name='guest-cart'),
     path('cart/<uuid:user_id>/remove/<int:item_id>/', views.remove_from_cart, name='remove-from-cart'),
     path('cart/<uuid:user_id>/clear/', views.clear_cart, name='clear-cart'),
 
@@ -30,4 +32,7 @@ urlpatterns = [
     path('payment/create-razorpay-order/', views.create_razorpay_order, name='create-razorpay-order'),
     path('payment/verify-payment/', views.verify_razorpay_payment, name='verify-razorpay-payment'),
     path('payment/razorpay-key/', views.get_razorpay_key, name='get-razorpay-key'),
+
+    # ============ RECOMMENDATION URLs ============
+    path('recommendations/bought-together/<uuid:product_id>/', views.bought_together, name='bought-together'),
 ]
\ No newline at end of file
@@ -1,12 +1,11 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.pagination import PageNumberPagination
-from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import F, Q
 from django.conf import settings
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.openapi import OpenApiTypes
@@ -14,18 +13,31 @@ import razorpay
 import hmac
 import hashlib
 
-from .models import Wishlist, Cart, CartItem, Order, OrderItem, Transaction, OrderStatusHistory
+from .models import Wishlist, Cart, CartItem, Order, OrderItem, Transaction, OrderStatusHistory, BoughtTogether
+from .recommendations import TOP_K
+from .sales import sync_order_sales
+from .cart import sync_cart, lock_cart, expected_version, CartSyncError, CartVersionConflict
+from .guest_cart import (
+    dump_guest_cart, load_guest_cart, guest_cart_token, update_guest_cart, render_guest_cart,
+    InvalidGuestCart, GUEST_CART_HEADER
+)
 from categories.models import Products
+from categories.serializers import ProductFieldSelection
 from users.models import Users, Addresses
+from webservices.identity_map import load_or_404
 from .serializers import (
     WishlistSerializer, CartSerializer, CartItemSerializer,
-    AddToCartSerializer, UpdateCartItemSerializer, OrderSerializer,
+    AddToCartSerializer, UpdateCartItemSerializer, CartSyncSerializer, GuestCartSerializer, OrderSerializer,
     CreateOrderSerializer, OrderStatusUpdateSerializer, TransactionSerializer,
     PaymentInitiateSerializer, PaymentVerificationSerializer,
     OrderStatusHistorySerializer, OrderFilterSerializer
 )
 
 
+# Product fields returned with recommendations
+RECOMMENDATION_FIELDS = ['productName', 'SKU', 'price', 'discount', 'discountPerc', 'totalStock', 'isActive']
+
+
 # ============ CUSTOM PAGINATION ============
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -38,7 +50,24 @@ class StandardResultsSetPagination(PageNumberPagination):
 
 def get_user_by_id(user_id):
     """Get user by ID or raise 404"""
-    return get_object_or_404(Users, pk=user_id)
+    return load_or_404(Users, pk=user_id)
+
+
+def cart_response(payload, cart, status_code=status.HTTP_200_OK):
+    """Respond with the cart version as ETag; clients send it back in If-Match"""
+    response = Response(payload, status=status_code)
+    response['ETag'] = f'"{cart.version}"'
+    return response
+
+
+def cart_conflict(exc):
+    response = Response({
+        'success': False,
+        'error': 'Cart was changed by another request. Reload it and try again.',
+        'version': exc.version
+    }, status=status.HTTP_409_CONFLICT)
+    response['ETag'] = f'"{exc.version}"'
+    return response
 
 
 # ============ WISHLIST VIEWS ============
@@ -188,14 +217,14 @@ def get_cart(request, user_id):
             status=status.HTTP_403_FORBIDDEN
         )
 
-    cart, created = Cart.objects.get_or_create(user=user)
+    cart, created = Cart.objects.with_items().get_or_create(user=user)
     serializer = CartSerializer(cart)
 
-    return Response({
+    return cart_response({
         'success': True,
         'data': serializer.data,
         'is_new_cart': created
-    })
+    }, cart)
 
 
 @extend_schema(
@@ -227,33 +256,30 @@ def add_to_cart(request):
 
         try:
             with transaction.atomic():
-                product = get_object_or_404(Products, pk=product_id)
-                cart, created = Cart.objects.get_or_create(user=user)
-
-                # Check if item with same size and color already exists in cart
-                cart_item, item_created = CartItem.objects.get_or_create(
-                    cart=cart,
-                    product=product,
-                    size=size,
-                    color=color,
-                    defaults={'quantity': quantity}
-                )
-
-                if not item_created:
-                    cart_item.quantity += quantity
-                    cart_item.save()
-                    message = f'Updated quantity to {cart_item.quantity} for size {size}, color {color}'
+                product = load_or_404(Products, pk=product_id)
+                cart, created = lock_cart(user, expected_version(request))
+
+                # Add to the item with the same size and color if it's already in the cart;
+                # the increment happens in the database so concurrent adds all count
+                existing = CartItem.objects.filter(cart=cart, product=product, size=size, color=color)
+                if existing.update(quantity=F('quantity') + quantity, updatedAt=timezone.now()):
+                    Cart.objects.filter(pk=cart.pk).refresh_totals()
+                    new_quantity = existing.values_list('quantity', flat=True).get()
+                    message = f'Updated quantity to {new_quantity} for size {size}, color {color}'
                 else:
+                    CartItem.objects.create(cart=cart, product=product, size=size, color=color, quantity=quantity)
                     message = f'Item added to cart successfully (Size: {size}, Color: {color})'
 
                 # Return updated cart
-                cart_serializer = CartSerializer(cart)
-                return Response({
+                cart = Cart.objects.with_items().get(pk=cart.pk)
+                return cart_response({
                     'success': True,
                     'message': message,
-                    'data': cart_serializer.data
-                }, status=status.HTTP_201_CREATED)
+                    'data': CartSerializer(cart).data
+                }, cart, status.HTTP_201_CREATED)
 
+        except CartVersionConflict as e:
+            return cart_conflict(e)
         except Exception as e:
             return Response({
                 'success': False,
@@ -288,29 +314,33 @@ def update_cart_item(request, user_id, item_id):
             'error': 'Permission denied'
         }, status=status.HTTP_403_FORBIDDEN)
 
-    try:
-        cart_item = CartItem.objects.get(
-            id=item_id,
-            cart__user=user
-        )
-    except CartItem.DoesNotExist:
-        return Response({
-            'success': False,
-            'error': 'Cart item not found'
-        }, status=status.HTTP_404_NOT_FOUND)
+    with transaction.atomic():
+        try:
+            cart, _ = lock_cart(user, expected_version(request), create=False)
+            cart_item = CartItem.objects.get(
+                id=item_id,
+                cart=cart
+            )
+        except CartVersionConflict as e:
+            return cart_conflict(e)
+        except CartItem.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Cart item not found'
+            }, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = UpdateCartItemSerializer(data=request.data, instance=cart_item)
+        serializer = UpdateCartItemSerializer(data=request.data, instance=cart_item)
 
-    if serializer.is_valid():
-        cart_item.quantity = serializer.validated_data['quantity']
-        cart_item.save()
+        if serializer.is_valid():
+            cart_item.quantity = serializer.validated_data['quantity']
+            cart_item.save()
 
-        cart_serializer = CartSerializer(cart_item.cart)
-        return Response({
-            'success': True,
-            'message': 'Cart item updated successfully',
-            'data': cart_serializer.data
-        })
+            cart = Cart.objects.with_items().get(pk=cart_item.cart_id)
+            return cart_response({
+                'success': True,
+                'message': 'Cart item updated successfully',
+                'data': CartSerializer(cart).data
+            }, cart)
 
     return Response({
         'success': False,
@@ -318,6 +348,110 @@ def update_cart_item(request, user_id, item_id):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@extend_schema(
+    summary="Apply a batch of cart changes",
+    request=CartSyncSerializer,
+    parameters=[
+        OpenApiParameter('user_id', OpenApiTypes.UUID, OpenApiParameter.PATH)
+    ],
+    responses=CartSerializer
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_cart_items(request, user_id):
+    """
+    Add, set or remove many cart lines in one transaction, e.g. for reorder
+    and merge flows. Either every operation is applied or none is; errors
+    carry the index of the offending operation.
+    """
+    user = get_user_by_id(user_id)
+
+    # Check permission
+    if request.user != user and not request.user.is_staff:
+        return Response({
+            'success': False,
+            'error': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = CartSyncSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    operations = serializer.validated_data['operations']
+    try:
+        cart, created = sync_cart(user, operations, expected_version(request))
+    except CartVersionConflict as e:
+        return cart_conflict(e)
+    except CartSyncError as e:
+        return Response({
+            'success': False,
+            'errors': e.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    cart = Cart.objects.with_items().get(pk=cart.pk)
+    return cart_response({
+        'success': True,
+        'message': f'Applied {len(operations)} cart operations',
+        'data': CartSerializer(cart).data,
+        'is_new_cart': created
+    }, cart)
+
+
+@extend_schema(
+    summary="Read or change a guest cart",
+    request=GuestCartSerializer,
+    parameters=[
+        OpenApiParameter(GUEST_CART_HEADER, OpenApiTypes.STR, OpenApiParameter.HEADER, required=False)
+    ]
+)
+@api_view(['GET', 'POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def guest_cart(request):
+    """
+    Cart for shoppers who haven't logged in, held in a signed token instead of
+    the database. GET renders the cart of the X-Guest-Cart token; POST applies
+    the same operations as the cart sync endpoint and returns the new token.
+    Send the token with verify-otp/login to merge it into the user's cart.
+    """
+    serializer = None
+    if request.method == 'POST':
+        serializer = GuestCartSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    token = guest_cart_token(request)
+    try:
+        lines = load_guest_cart(token) if token else {}
+        if serializer is not None:
+            lines = update_guest_cart(lines, serializer.validated_data['operations'])
+    except InvalidGuestCart:
+        return Response({
+            'success': False,
+            'error': 'Invalid or expired guest cart'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except CartSyncError as e:
+        return Response({
+            'success': False,
+            'errors': e.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    token = dump_guest_cart(lines)
+    response = Response({
+        'success': True,
+        'guest_cart': token,
+        'data': render_guest_cart(lines, {'request': request})
+    })
+    response[GUEST_CART_HEADER] = token
+    return response
+
+
 @extend_schema(
     summary="Remove item from cart",
     parameters=[
@@ -339,17 +473,22 @@ def remove_from_cart(request, user_id, item_id):
         }, status=status.HTTP_403_FORBIDDEN)
 
     try:
-        cart_item = CartItem.objects.get(
-            id=item_id,
-            cart__user=user
-        )
-        product_name = cart_item.product.productName
-        cart_item.delete()
+        with transaction.atomic():
+            cart, _ = lock_cart(user, expected_version(request), create=False)
+            cart_item = CartItem.objects.select_related('product').get(
+                id=item_id,
+                cart=cart
+            )
+            product_name = cart_item.product.productName
+            cart_item.delete()
+            cart.refresh_from_db(fields=['version'])
 
-        return Response({
+        return cart_response({
             'success': True,
             'message': f'{product_name} removed from cart successfully'
-        })
+        }, cart)
+    except CartVersionConflict as e:
+        return cart_conflict(e)
     except CartItem.DoesNotExist:
         return Response({
             'success': False,
@@ -377,19 +516,25 @@ def clear_cart(request, user_id):
         }, status=status.HTTP_403_FORBIDDEN)
 
     try:
-        cart = Cart.objects.get(user=user)
-        items_count = cart.items.count()
-        cart.items.all().delete()
-
-        return Response({
-            'success': True,
-            'message': f'Cart cleared successfully. {items_count} items removed.'
-        })
-    except Cart.DoesNotExist:
-        return Response({
-            'success': True,
-            'message': 'Cart is already empty'
-        })
+        with transaction.atomic():
+            cart, _ = lock_cart(user, expected_version(request), create=False)
+            if cart is None:
+                return Response({
+                    'success': True,
+                    'message': 'Cart is already empty'
+                })
+            items_count = cart.itemsCount
+            # One totals refresh instead of a refresh per item
+            cart.items.all().delete_without_signals()
+            Cart.objects.filter(pk=cart.pk).refresh_totals()
+            cart.refresh_from_db(fields=['version'])
+    except CartVersionConflict as e:
+        return cart_conflict(e)
+
+    return cart_response({
+        'success': True,
+        'message': f'Cart cleared successfully. {items_count} items removed.'
+    }, cart)
 
 
 # ============ ORDER VIEWS ============
@@ -535,11 +680,12 @@ def create_order(request):
 
         try:
             with transaction.atomic():
-                # Get user's cart
-                cart = Cart.objects.get(user=user)
-                cart_items = cart.items.all()
+                # Locked until the order is in, so a concurrent sync or
+                # add-to-cart can't change the lines the order is built from
+                cart, _ = lock_cart(user, expected_version(request), create=False)
+                cart_items = list(cart.items.select_related('product')) if cart else []
 
-                if not cart_items.exists():
+                if not cart_items:
                     return Response({
                         'success': False,
                         'error': 'Cart is empty'
@@ -548,7 +694,7 @@ def create_order(request):
                 # Create order
                 order_data = {
                     'user': user,
-                    'shippingAddress': get_object_or_404(
+                    'shippingAddress': load_or_404(
                         Addresses, pk=serializer.validated_data['shipping_address_id']
                     ),
                     'notes': serializer.validated_data.get('notes', ''),
@@ -557,7 +703,7 @@ def create_order(request):
                 }
 
                 if serializer.validated_data.get('billing_address_id'):
-                    order_data['billingAddress'] = get_object_or_404(
+                    order_data['billingAddress'] = load_or_404(
                         Addresses, pk=serializer.validated_data['billing_address_id']
                     )
 
@@ -590,7 +736,8 @@ def create_order(request):
                 )
 
                 # Clear cart
-                cart_items.delete()
+                cart.items.all().delete_without_signals()
+                Cart.objects.filter(pk=cart.pk).refresh_totals()
 
                 order_serializer = OrderSerializer(order)
                 return Response({
@@ -599,6 +746,8 @@ def create_order(request):
                     'data': order_serializer.data
                 }, status=status.HTTP_201_CREATED)
 
+        except CartVersionConflict as e:
+            return cart_conflict(e)
         except Exception as e:
             return Response({
                 'success': False,
@@ -653,7 +802,10 @@ def update_order_status(request, order_id):
             order.deliveredAt = timezone.now()
             order.paymentStatus = 'PAID'  # Assume payment is confirmed on delivery
 
-        order.save()
+        # Explicit fields: salesCounted belongs to sync_order_sales and must not be clobbered
+        with transaction.atomic():
+            order.save(update_fields=['status', 'trackingId', 'deliveredAt', 'paymentStatus', 'updatedAt'])
+            sync_order_sales(order)
 
         # Create status history
         OrderStatusHistory.objects.create(
@@ -708,7 +860,9 @@ def cancel_order(request, user_id, order_id):
 
         # Cancel order
         order.status = 'CANCELLED'
-        order.save()
+        with transaction.atomic():
+            order.save(update_fields=['status', 'updatedAt'])
+            sync_order_sales(order)
 
         # Create status history
         OrderStatusHistory.objects.create(
@@ -888,7 +1042,8 @@ def verify_razorpay_payment(request):
             with transaction.atomic():
                 order.paymentStatus = 'PAID'
                 order.status = 'CONFIRMED'
-                order.save()
+                order.save(update_fields=['paymentStatus', 'status', 'updatedAt'])
+                sync_order_sales(order)
 
                 # Create transaction record
                 txn = Transaction.objects.create(
@@ -956,4 +1111,36 @@ def get_razorpay_key(request):
     return Response({
         'success': True,
         'key_id': settings.RAZORPAY_KEY_ID
-    })
\ No newline at end of file
+    })
+
+# ============ RECOMMENDATION VIEWS ============
+
+@extend_schema(
+    summary="Products frequently bought together with a product",
+    parameters=[
+        OpenApiParameter('product_id', OpenApiTypes.UUID, OpenApiParameter.PATH),
+        OpenApiParameter('limit', OpenApiTypes.INT, description=f"Max products (default and max {TOP_K})"),
+    ]
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def bought_together(request, product_id):
+    """Served from the precomputed BoughtTogether table (see build_bought_together)"""
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', TOP_K)), TOP_K))
+    except ValueError:
+        return Response({'success': False, 'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    links = list(
+        BoughtTogether.objects.filter(product_id=product_id, related__isActive=True)
+        .order_by('rank').values_list('related_id', 'count')[:limit]
+    )
+    selection = ProductFieldSelection(fields=RECOMMENDATION_FIELDS, expand=['images'])
+    products = selection.apply(Products.objects.all()).in_bulk([related_id for related_id, _ in links])
+
+    data = []
+    for related_id, count in links:
+        item = selection.serializer(products[related_id]).data
+        item['boughtTogetherCount'] = count
+        data.append(item)
+    return Response({'success': True, 'data': data})
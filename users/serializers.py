@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from .utils import sendOTPForMobile, send_successfully_account_created_sms
 from rest_framework_simplejwt.tokens import RefreshToken
+from webservices.identity_map import load
 
 class SendOTPSerializer(serializers.Serializer):
     phoneNumber = serializers.CharField(max_length=15)
@@ -39,9 +40,12 @@ class VerifyOTPSerializer(serializers.Serializer):
     otp = serializers.CharField(max_length=6)
 
     def validate(self, data):
+        # Through the identity map, so the view gets this same instance back
         try:
-            user = Users.objects.get(phoneNumber=data['phoneNumber'], otp=data['otp'])
+            user = load(Users, phoneNumber=data['phoneNumber'])
         except Users.DoesNotExist:
+            user = None
+        if user is None or user.otp != data['otp']:
             raise serializers.ValidationError({"error": "Invalid OTP or phone number"})
 
         # Check if OTP is expired (valid for 10 minutes)
@@ -137,7 +141,7 @@ class LoginSerializer(serializers.Serializer):
         password = data.get('password')
 
         try:
-            user = Users.objects.get(phoneNumber=phone)
+            user = load(Users, phoneNumber=phone)
         except Users.DoesNotExist:
             raise serializers.ValidationError({"error": "Invalid phone number or password"})
 
@@ -12,6 +12,15 @@ from .serializers import (
 )
 from .utils import send_html_mail
 from .models import Users
+from transactions.guest_cart import merge_guest_cart_from_request
+from webservices.identity_map import load
+
+
+def guest_cart_fields(request, user):
+    """Merge the request's guest cart; once a token was sent the client must drop it, merged or not"""
+    merged = merge_guest_cart_from_request(request, user)
+    return {"guest_cart_merged": merged, "discard_guest_cart": merged is not None}
+
 
 def home(request):
     return HttpResponse("<h1>Hello world</h1>")
@@ -78,12 +87,15 @@ def verify_otp(request):
     Verify OTP sent to phone number.
     - For existing users: Returns JWT tokens and user data (auto-login)
     - For new users: Returns is_new_user flag to proceed with signup
+    A guest cart token (X-Guest-Cart header or guest_cart field) is merged into the user's cart.
     """
     serializer = VerifyOTPSerializer(data=request.data)
     if serializer.is_valid():
+        user = load(Users, pk=serializer.validated_data['userId'])
         return Response({
             "message": "OTP verified successfully",
             "data": serializer.validated_data,
+            **guest_cart_fields(request, user),
             "success": True
         }, status=200)
     else:
@@ -153,13 +165,16 @@ def login(request):
     """
     Login with phone number and password.
     Returns: JWT tokens and user data
+    A guest cart token (X-Guest-Cart header or guest_cart field) is merged into the user's cart.
     """
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
+        user = load(Users, pk=serializer.validated_data['userId'])
         return Response({
             "message": "Login successful",
             "success": True,
-            "data": serializer.validated_data
+            "data": serializer.validated_data,
+            **guest_cart_fields(request, user)
         }, status=status.HTTP_200_OK)
     else:
         return Response({
@@ -0,0 +1,90 @@
+"""
+Request-scoped identity map.
+
+Views and serializers that handle the same request often look up the same
+rows (a serializer validates that a product exists, the view then loads
+it again). `load()` returns the instance already fetched during the current
+request instead of querying again, so each row is read at most once.
+
+Only use it for reads: an instance from the map reflects the row as it was
+first loaded, so code that needs fresh or locked state should query directly.
+Outside a request (commands, background threads) every call hits the database.
+"""
+import logging
+from collections import Counter
+from contextvars import ContextVar
+
+from django.db import models
+from django.http import Http404
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('identity_map', default=None)
+
+
+class IdentityMap:
+    def __init__(self):
+        self._rows = {}
+        self.saved = Counter()
+
+    def key(self, model, name, value):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            value = value.pk if isinstance(value, models.Model) else value
+            return (model._meta.label, field.attname, field.target_field.to_python(value))
+        return (model._meta.label, field.attname, field.to_python(value))
+
+    def load(self, model, **lookup):
+        (name, value), = lookup.items()
+        if name == 'pk':
+            name = model._meta.pk.name
+        key = self.key(model, name, value)
+        instance = self._rows.get(key)
+        if instance is not None:
+            self.saved[model.__name__] += 1
+            return instance
+        # Misses aren't remembered: the row may still be created later in the request
+        instance = model.objects.get(**{name: value})
+        self._rows[key] = instance
+        self._rows[self.key(model, model._meta.pk.name, instance.pk)] = instance
+        return instance
+
+
+def load(model, **lookup):
+    """
+    Fetch one row by its primary key or another unique field (a single
+    keyword, e.g. pk=... or user=...), reusing the instance already loaded
+    by this request. Raises model.DoesNotExist like objects.get().
+    """
+    identity_map = _current.get()
+    if identity_map is None:
+        return model.objects.get(**lookup)
+    return identity_map.load(model, **lookup)
+
+
+def load_or_404(model, **lookup):
+    try:
+        return load(model, **lookup)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+
+class IdentityMapMiddleware:
+    """Give every request its own identity map and log the lookups it saved at DEBUG level"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        identity_map = IdentityMap()
+        token = _current.set(identity_map)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            if identity_map.saved and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Identity map saved %d lookups on %s %s: %s",
+                    sum(identity_map.saved.values()), request.method, request.path,
+                    ', '.join(f'{name} x{count}' for name, count in identity_map.saved.most_common())
+                )
@@ -73,6 +73,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'webservices.identity_map.IdentityMapMiddleware',
 ]
 
 ROOT_URLCONF = 'webservices.urls'
@@ -212,6 +213,11 @@ AWS_S3_REGION_NAME = config('AWS_REGION')
 AWS_S3_ENDPOINT_URL = config('BUCKET_URL')
 # AWS_S3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.ap-south-1.amazonaws.com"
 
+# Public/CDN base serving stored files by key; when set, media URLs are built
+# without boto. Otherwise presigned URLs are cached for MEDIA_URL_CACHE_TTL seconds.
+MEDIA_PUBLIC_BASE_URL = config('MEDIA_PUBLIC_BASE_URL', default='')
+MEDIA_URL_CACHE_TTL = config('MEDIA_URL_CACHE_TTL', default=1800, cast=int)
+
 
 #EMAIL CRED For sent mails
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -223,6 +229,25 @@ EMAIL_USE_SSL = True
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 
+# Per-worker LRU of serialized product detail payloads (categories.cache)
+PRODUCT_CACHE_SIZE = config('PRODUCT_CACHE_SIZE', default=2000, cast=int)
+# Seconds an entry lives while media URLs are presigned; keep well under AWS_QUERYSTRING_EXPIRE
+PRODUCT_CACHE_TTL = config('PRODUCT_CACHE_TTL', default=MEDIA_URL_CACHE_TTL // 2, cast=int)
+
+# Resized WebP/JPEG copies of uploaded images (categories.images)
+IMAGE_VARIANT_WIDTHS = (160, 480, 960)
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+
+# Seconds a dashboard snapshot may lag behind the sales counters (categories.dashboard)
+DASHBOARD_SALES_REFRESH = config('DASHBOARD_SALES_REFRESH', default=300, cast=int)
+
+# Days for a sale's weight in Products.trendingScore to halve (transactions.trending)
+TRENDING_HALF_LIFE_DAYS = config('TRENDING_HALF_LIFE_DAYS', default=7, cast=float)
+
+# Seconds a signed guest cart token stays valid (transactions.guest_cart)
+GUEST_CART_MAX_AGE = config('GUEST_CART_MAX_AGE', default=30 * 24 * 3600, cast=int)
+
+
 # Razorpay Payment Gateway Settings
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='rzp_test_EqSp950wLrSSjT')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')